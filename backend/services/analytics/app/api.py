@@ -12,12 +12,18 @@ from .schemas import (
     ReportScheduleOut,
 )
 from .tasks import generate_report
+from .refcache import ReferenceCache
 
 router = APIRouter(prefix="/api/analytics")
 
+report_types = ReferenceCache(
+    "report_types",
+    lambda db: [ReportTypeOut.model_validate(t, from_attributes=True) for t in db.query(ReportType).order_by(ReportType.id)],
+)
+
 @router.get("/report-types", response_model=list[ReportTypeOut])
 def list_report_types(db: Session = Depends(get_db)):
-    return db.query(ReportType).all()
+    return report_types.get(db)
 
 @router.post("/reports", response_model=ReportRequestOut)
 def request_report(data: ReportRequestCreate, db: Session = Depends(get_db)):
@@ -5,6 +5,7 @@ class Settings(BaseSettings):
     rabbitmq_url: str
     log_level: str = "info"
     port: int = 8000
+    reference_check_interval: float = 5  # seconds between reference_versions checks
 
     class Config:
         env_file = ".env"
@@ -55,3 +55,11 @@ class ReportSchedule(Base):
     updated_at = Column(TIMESTAMP, default=datetime.utcnow)
 
     report_type = relationship("ReportType")
+
+
+class ReferenceVersion(Base):
+    """Version counter per cached reference table, see ``refcache``."""
+    __tablename__ = "reference_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,56 @@
+"""In-process cache for small reference tables.
+
+Each cached table has a row in ``reference_versions``. Writers bump the
+version in the same transaction as their change; readers serve from memory and
+compare the stored version at most every ``REFERENCE_CHECK_INTERVAL`` seconds,
+reloading the table only when it moved. A write is visible at once in the
+worker that made it and within the interval everywhere else.
+"""
+import threading
+import time
+from typing import Callable, Generic, TypeVar
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .models import ReferenceVersion
+
+T = TypeVar("T")
+
+
+class ReferenceCache(Generic[T]):
+    def __init__(self, name: str, load: Callable[[Session], T], check_interval: float | None = None):
+        self.name = name
+        self.load = load
+        self.check_interval = get_settings().reference_check_interval if check_interval is None else check_interval
+        self._value: T | None = None
+        self._version: int | None = None
+        self._checked_at = 0.0
+        # Sync endpoints run in a thread pool
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> T:
+        with self._lock:
+            now = time.monotonic()
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return self._value
+            version = db.query(ReferenceVersion.version).filter_by(name=self.name).scalar() or 0
+            if version != self._version:
+                self._value = self.load(db)
+                self._version = version
+            self._checked_at = now
+            return self._value
+
+    def bump(self, db: Session):
+        """Increment the stored version; call before committing the change it covers."""
+        insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(ReferenceVersion).values(name=self.name, version=1)
+        db.execute(stmt.on_conflict_do_update(index_elements=[ReferenceVersion.name], set_={"version": ReferenceVersion.version + 1}))
+
+    def invalidate(self):
+        """Drop the local copy; call after the commit that bumped the version."""
+        with self._lock:
+            self._version = None
+            self._value = None
@@ -15,7 +15,7 @@ os.environ.setdefault("RABBITMQ_URL", "memory://")
 
 from services.analytics.app.main import app
 from services.analytics.app.database import Base, engine, SessionLocal
-from services.analytics.app import models
+from services.analytics.app import api, models
 
 Base.metadata.create_all(bind=engine)
 client = TestClient(app)
@@ -35,3 +35,20 @@ def test_request_report():
     data = resp.json()
     assert data["status"] == "pending"
     db.close()
+
+def test_report_types_cached_until_version_bump():
+    db = SessionLocal()
+    if not db.query(models.ReportType).filter_by(id=1).first():
+        db.add(models.ReportType(id=1, code="basic"))
+        db.commit()
+    codes = [t["code"] for t in client.get("/api/analytics/report-types").json()]
+    assert "basic" in codes
+
+    db.add(models.ReportType(id=2, code="activity"))
+    api.report_types.bump(db)
+    db.commit()
+    db.close()
+    # still served from memory until the next version check
+    assert [t["code"] for t in client.get("/api/analytics/report-types").json()] == codes
+    api.report_types._checked_at = 0
+    assert [t["code"] for t in client.get("/api/analytics/report-types").json()] == codes + ["activity"]
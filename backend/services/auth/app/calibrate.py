@@ -0,0 +1,55 @@
+"""Measure bcrypt cost on this machine and recommend rounds for a latency budget.
+
+    python -m app.calibrate --target-ms 250
+
+Each extra round doubles the hashing time, so the recommendation is the
+highest cost whose median hash time still fits in the budget.
+"""
+import argparse
+import statistics
+import time
+
+from .config import settings
+from .utils import hash_password
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+
+def measure(rounds: int, samples: int) -> float:
+    """Median time in milliseconds to hash one password at ``rounds``."""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hash_password("calibration-password", rounds)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms: float, samples: int = 3) -> tuple[int, dict[int, float]]:
+    """Return the recommended rounds and the timings measured on the way."""
+    timings = {}
+    best = MIN_ROUNDS
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        timings[rounds] = measure(rounds, samples)
+        if timings[rounds] > target_ms:
+            break
+        best = rounds
+    return best, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend bcrypt rounds for a latency budget")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    best, timings = calibrate(args.target_ms, args.samples)
+    for rounds, ms in timings.items():
+        marker = " <- recommended" if rounds == best else ""
+        print(f"rounds={rounds:<2} {ms:9.1f} ms{marker}")
+    print(f"current AUTH_BCRYPT_ROUNDS={settings.bcrypt_rounds}, recommended {best} for {args.target_ms:g} ms")
+
+
+if __name__ == "__main__":
+    main()
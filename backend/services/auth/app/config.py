@@ -3,8 +3,28 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     database_url: str = os.getenv("AUTH_DATABASE_URL", "sqlite:///./auth.db")
+    db_pool_size: int = int(os.getenv("AUTH_DB_POOL_SIZE", "20"))
+    db_max_overflow: int = int(os.getenv("AUTH_DB_MAX_OVERFLOW", "30"))
+    db_pool_recycle: int = int(os.getenv("AUTH_DB_POOL_RECYCLE", "1800"))  # seconds
+    db_pool_pre_ping: bool = os.getenv("AUTH_DB_POOL_PRE_PING", "true").lower() == "true"
+    db_pool_timeout: int = int(os.getenv("AUTH_DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
     jwt_secret: str = os.getenv("JWT_SECRET", "secret")
     access_token_ttl: int = 3600  # 1h
     refresh_token_ttl: int = 30 * 24 * 3600  # 30d
+    bcrypt_rounds: int = int(os.getenv("AUTH_BCRYPT_ROUNDS", "12"))  # see `python -m app.calibrate`
+    hash_workers: int = int(os.getenv("AUTH_HASH_WORKERS", os.cpu_count() or 1))
+    hash_max_pending: int = int(os.getenv("AUTH_HASH_MAX_PENDING", "64"))
+    hash_retry_after: int = 1  # seconds, sent with 503 when the pool is full
+    rate_limit_url: str = os.getenv("AUTH_RATE_LIMIT_URL", "")  # redis:// URL shares limits across workers
+    send_code_interval: int = 30  # seconds between codes for one phone
+    verify_attempts_per_phone: int = 10  # per 5 minutes
+    requests_per_ip_per_minute: int = 30
+    trusted_proxies: str = os.getenv("AUTH_TRUSTED_PROXIES", "")  # comma-separated IPs/CIDRs allowed to set X-Forwarded-For
+    sms_code_ttl: int = 300  # 5 min
+    purge_interval: int = int(os.getenv("AUTH_PURGE_INTERVAL", "3600"))  # 0 disables the in-process purger
+    purge_chunk_size: int = 5000
+    provision_batch_size: int = 1000
+    provision_token: str = os.getenv("AUTH_PROVISION_TOKEN", "")  # X-Service-Token for bulk provisioning; empty disables it
+    revocation_sync_interval: int = int(os.getenv("AUTH_REVOCATION_SYNC_INTERVAL", "5"))  # seconds until a logout reaches other workers
 
 settings = Settings()
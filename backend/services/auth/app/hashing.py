@@ -0,0 +1,95 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from .config import settings
+from .utils import hash_password, verify_password
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool cannot accept another job."""
+
+
+class HashingPool:
+    """Runs bcrypt in worker processes so hashing never blocks the event loop.
+
+    At most ``workers + max_pending`` jobs are admitted at a time; further
+    callers get :class:`HashingBusy` immediately instead of queueing forever.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def limit(self) -> int:
+        return self.workers + self.max_pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.limit:
+            raise HashingBusy()
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def map(self, fn, *iterables) -> list:
+        """Run ``fn`` over ``iterables`` in the pool, admitting every job or none.
+
+        Rejecting the whole batch up front means a busy pool never starts jobs
+        whose results would be thrown away when the batch is retried.
+        """
+        jobs = list(zip(*iterables))
+        if self.in_flight + len(jobs) > self.limit:
+            raise HashingBusy()
+        self.in_flight += len(jobs)
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            return await asyncio.gather(*(loop.run_in_executor(executor, fn, *args) for args in jobs))
+        finally:
+            self.in_flight -= len(jobs)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(settings.hash_workers, settings.hash_max_pending)
+
+
+async def hash_password_async(password: str) -> str:
+    return await hashing_pool.run(hash_password, password, settings.bcrypt_rounds)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await hashing_pool.run(verify_password, password, hashed)
+
+
+async def hash_passwords_async(passwords: list[str]) -> list[str]:
+    """Hash many passwords without starving interactive requests.
+
+    At most one job per worker is queued at a time so logins wait behind one
+    hash, not the whole list; a chunk is admitted whole or not at all, and when
+    the pool is saturated it backs off before retrying.
+    """
+    hashes = []
+    step = hashing_pool.workers
+    for start in range(0, len(passwords), step):
+        chunk = passwords[start:start + step]
+        while True:
+            try:
+                hashes.extend(await hashing_pool.map(hash_password, chunk, [settings.bcrypt_rounds] * len(chunk)))
+                break
+            except HashingBusy:
+                await asyncio.sleep(settings.hash_retry_after)
+    return hashes
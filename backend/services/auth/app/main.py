@@ -1,11 +1,18 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import asyncio
+import ipaddress
+import json
+import secrets
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 import uuid
 import os
+import jwt
 
 from .config import settings
-from .database import SessionLocal, init_db
+from .database import AsyncSessionLocal, get_session, init_db
 from .models import User, SMSCode, RefreshToken, PasswordResetToken
 from .schemas import (
     SendCodeRequest,
@@ -14,12 +21,19 @@ from .schemas import (
     EmailLoginRequest,
     ForgotPasswordRequest,
     ResetPasswordRequest,
+    RefreshRequest,
+    TokenResponse,
     AuthResponse,
     UserOut,
 )
-from .utils import hash_password, verify_password, create_access_token, create_refresh_token
+from .utils import create_access_token, create_refresh_token, decode_access_token, hash_token, needs_rehash
+from .hashing import HashingBusy, hashing_pool, hash_password_async, hash_passwords_async, verify_password_async
+from .ratelimit import backend as rate_limit_backend, send_code_by_phone, verify_by_phone, requests_by_ip
+from .purge import run_periodically
+from . import revocation
+from .revocation import revoke, revoked_tokens
+from .provisioning import parse_rows, provision
 
-init_db()
 ROOT_PATH = os.getenv("ROOT_PATH", "")
 app = FastAPI(
     title="Auth Service",
@@ -30,134 +44,251 @@ app = FastAPI(
 )
 
 
-def get_db():
-    db = SessionLocal()
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request: Request, exc: HashingBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service busy, retry later"},
+        headers={"Retry-After": str(settings.hash_retry_after)},
+    )
+
+
+@app.on_event("startup")
+async def startup_event():
+    await init_db()
+    if settings.purge_interval:
+        app.state.purger = asyncio.create_task(run_periodically(settings.purge_interval))
+    await revocation.sync_once()
+    app.state.revocation_sync = asyncio.create_task(revocation.run_periodically(settings.revocation_sync_interval))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    hashing_pool.shutdown()
+    for name in ("purger", "revocation_sync"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    await rate_limit_backend.close()
+
+
+def _issue_refresh_token(db: AsyncSession, user_id: str, now: datetime, ttl: timedelta, family_id: str | None = None) -> str:
+    """Add a refresh token row and return the raw token; only its hash is stored."""
+    value = create_refresh_token()
+    db.add(RefreshToken(token=hash_token(value), user_id=user_id, family_id=family_id or str(uuid.uuid4()), created_at=now, expires_at=now + ttl))
+    return value
+
+
+def _bearer_claims(authorization: str | None) -> dict | None:
+    """Claims of the ``Authorization: Bearer`` access token, or None if absent or invalid."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
     try:
-        yield db
-    finally:
-        db.close()
+        return decode_access_token(token)
+    except jwt.InvalidTokenError:
+        return None
+
+
+TRUSTED_PROXIES = [ipaddress.ip_network(net.strip()) for net in settings.trusted_proxies.split(",") if net.strip()]
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in net for net in TRUSTED_PROXIES)
+
+
+def _client_ip(request: Request) -> str:
+    """The peer address, or behind trusted proxies the last X-Forwarded-For hop they did not add."""
+    host = request.client.host if request.client else "unknown"
+    # Proxies append, so hops left of the last untrusted one may be made up by the client
+    hops = [hop.strip() for hop in ",".join(request.headers.getlist("x-forwarded-for")).split(",") if hop.strip()]
+    while hops and _is_trusted_proxy(host):
+        host = hops.pop()
+    return host
+
+
+async def _check_rate(request: Request, phone_limiter, phone: str):
+    if not await requests_by_ip.allow(_client_ip(request)) or not await phone_limiter.allow(phone):
+        raise HTTPException(status_code=429, detail="Too Many Requests")
 
 
 @app.post("/api/auth/phone/send-code")
-def send_code(data: SendCodeRequest, db: Session = Depends(get_db)):
+async def send_code(data: SendCodeRequest, request: Request, db: AsyncSession = Depends(get_session)):
+    await _check_rate(request, send_code_by_phone, data.phone)
     now = datetime.utcnow()
-    last_code = db.query(SMSCode).filter(SMSCode.phone == data.phone).order_by(SMSCode.sent_at.desc()).first()
-    if last_code and (now - last_code.sent_at).total_seconds() < 30:
-        raise HTTPException(status_code=429, detail="Too Many Requests")
     code = f"{uuid.uuid4().int % 1000000:06d}"
     sms = SMSCode(phone=data.phone, code=code, sent_at=now)
     db.add(sms)
-    db.commit()
+    await db.commit()
     # Placeholder: send SMS via provider
     return {"message": "Code sent"}
 
 
 @app.post("/api/auth/phone/verify", response_model=AuthResponse)
-def verify_phone(data: VerifyPhoneRequest, db: Session = Depends(get_db)):
+async def verify_phone(data: VerifyPhoneRequest, request: Request, db: AsyncSession = Depends(get_session)):
+    await _check_rate(request, verify_by_phone, data.phone)
     now = datetime.utcnow()
-    sms = (
-        db.query(SMSCode)
-        .filter(SMSCode.phone == data.phone)
+    sms = await db.scalar(
+        select(SMSCode)
+        .where(SMSCode.phone == data.phone)
         .order_by(SMSCode.sent_at.desc())
-        .first()
+        .limit(1)
     )
-    if not sms or (now - sms.sent_at).total_seconds() > 300 or sms.attempts >= 5:
+    if not sms or (now - sms.sent_at).total_seconds() > settings.sms_code_ttl or sms.attempts >= 5:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired code")
     if sms.code != data.code:
+        # Failed attempts are recorded even though the request is rejected
         sms.attempts += 1
-        db.commit()
         if sms.attempts >= 5:
-            user = db.query(User).filter(User.phone == data.phone).first()
+            user = await db.scalar(select(User).where(User.phone == data.phone))
             if user:
                 user.blocked_until = now + timedelta(hours=1)
-                db.commit()
+        await db.commit()
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired code")
 
-    user = db.query(User).filter(User.phone == data.phone).first()
+    user = await db.scalar(select(User).where(User.phone == data.phone))
     if not user:
         if not data.email or not data.password:
             raise HTTPException(status_code=400, detail="Email and password required for registration")
-        user = User(login_type="phone", phone=data.phone, email=data.email, is_active=True, password_hash=hash_password(data.password))
+        user = User(login_type="phone", phone=data.phone, email=data.email, is_active=True, password_hash=await hash_password_async(data.password))
         db.add(user)
-        db.commit()
+        await db.flush()
     elif user.blocked_until and user.blocked_until > now:
         raise HTTPException(status_code=status.HTTP_423_LOCKED, detail="Phone temporarily blocked")
     sms.attempts = 0
-    db.commit()
     access = create_access_token(user.id)
-    refresh_value = create_refresh_token()
-    refresh = RefreshToken(token=refresh_value, user_id=user.id, expires_at=now + timedelta(seconds=settings.refresh_token_ttl * (2 if data.remember_me else 1)))
-    db.add(refresh)
-    db.commit()
+    refresh_value = _issue_refresh_token(db, user.id, now, timedelta(seconds=settings.refresh_token_ttl * (2 if data.remember_me else 1)))
+    await db.commit()
     return AuthResponse(access_token=access, refresh_token=refresh_value, user=UserOut(id=user.id, phone=user.phone, email=user.email, is_active=user.is_active))
 
 
 @app.post("/api/auth/email/register")
-def email_register(data: EmailRegisterRequest, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == data.email).first():
+async def email_register(data: EmailRegisterRequest, db: AsyncSession = Depends(get_session)):
+    if await db.scalar(select(User.id).where(User.email == data.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
     token = str(uuid.uuid4())
-    user = User(login_type="email", email=data.email, password_hash=hash_password(data.password), is_active=False, email_token=token, email_token_expires=datetime.utcnow() + timedelta(hours=24))
+    user = User(login_type="email", email=data.email, password_hash=await hash_password_async(data.password), is_active=False, email_token=token, email_token_expires=datetime.utcnow() + timedelta(hours=24))
     db.add(user)
-    db.commit()
+    await db.commit()
     # Placeholder: send email with confirmation link containing token
     return {"message": "Confirmation sent"}
 
 
+@app.post("/internal/auth/users/bulk")
+async def bulk_provision(request: Request, x_service_token: str | None = Header(None)):
+    """Create email users from an NDJSON or CSV body, streaming one NDJSON result per row."""
+    if not settings.provision_token or not secrets.compare_digest(x_service_token or "", settings.provision_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Service token required")
+    fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    rows = parse_rows((await request.body()).decode("utf-8"), fmt)
+
+    async def results():
+        async with AsyncSessionLocal() as db:
+            async for result in provision(db, rows, hash_passwords_async):
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @app.get("/api/auth/email/confirm")
-def email_confirm(token: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email_token == token, User.email_token_expires > datetime.utcnow()).first()
+async def email_confirm(token: str, db: AsyncSession = Depends(get_session)):
+    user = await db.scalar(select(User).where(User.email_token == token, User.email_token_expires > datetime.utcnow()))
     if not user:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
     user.is_active = True
     user.email_token = None
     user.email_token_expires = None
-    db.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
-    db.commit()
+    await db.execute(delete(RefreshToken).where(RefreshToken.user_id == user.id))
+    await db.commit()
     return {"message": "Email confirmed"}
 
 
 @app.post("/api/auth/email/login", response_model=AuthResponse)
-def email_login(data: EmailLoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == data.email, User.login_type == "email").first()
-    if not user or not verify_password(data.password, user.password_hash):
+async def email_login(data: EmailLoginRequest, db: AsyncSession = Depends(get_session)):
+    user = await db.scalar(select(User).where(User.email == data.email, User.login_type == "email"))
+    if not user or not await verify_password_async(data.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    if needs_rehash(user.password_hash):
+        # Move the stored hash to the configured cost while we know the password
+        user.password_hash = await hash_password_async(data.password)
     access = create_access_token(user.id)
     now = datetime.utcnow()
-    refresh_value = create_refresh_token()
-    refresh = RefreshToken(token=refresh_value, user_id=user.id, expires_at=now + timedelta(seconds=settings.refresh_token_ttl * (2 if data.remember_me else 1)))
-    db.add(refresh)
-    db.commit()
+    refresh_value = _issue_refresh_token(db, user.id, now, timedelta(seconds=settings.refresh_token_ttl * (2 if data.remember_me else 1)))
+    await db.commit()
     return AuthResponse(access_token=access, refresh_token=refresh_value, user=UserOut(id=user.id, phone=user.phone, email=user.email, is_active=user.is_active))
 
 
 @app.post("/api/auth/email/forgot")
-def forgot_password(data: ForgotPasswordRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == data.email).first()
-    if user:
+async def forgot_password(data: ForgotPasswordRequest, db: AsyncSession = Depends(get_session)):
+    user_id = await db.scalar(select(User.id).where(User.email == data.email))
+    if user_id:
         token = str(uuid.uuid4())
-        reset = PasswordResetToken(token=token, user_id=user.id, expires_at=datetime.utcnow() + timedelta(minutes=15))
-        db.merge(reset)
-        db.commit()
+        reset = PasswordResetToken(token=token, user_id=user_id, expires_at=datetime.utcnow() + timedelta(minutes=15))
+        await db.merge(reset)
+        await db.commit()
         # Placeholder: send email with reset token
     return {"message": "If email exists, reset link sent"}
 
 
 @app.post("/api/auth/email/reset")
-def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_db)):
-    reset = db.query(PasswordResetToken).filter(PasswordResetToken.token == data.token, PasswordResetToken.expires_at > datetime.utcnow()).first()
+async def reset_password(data: ResetPasswordRequest, db: AsyncSession = Depends(get_session)):
+    reset = await db.scalar(select(PasswordResetToken).where(PasswordResetToken.token == data.token, PasswordResetToken.expires_at > datetime.utcnow()))
     if not reset:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
-    user = db.query(User).filter(User.id == reset.user_id).first()
-    user.password_hash = hash_password(data.new_password)
-    db.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
-    db.delete(reset)
-    db.commit()
+    password_hash = await hash_password_async(data.new_password)
+    await db.execute(update(User).where(User.id == reset.user_id).values(password_hash=password_hash))
+    await db.execute(delete(RefreshToken).where(RefreshToken.user_id == reset.user_id))
+    await db.delete(reset)
+    await db.commit()
     return {"message": "Password updated"}
 
 
+@app.post("/api/auth/refresh", response_model=TokenResponse)
+async def refresh_tokens(data: RefreshRequest, db: AsyncSession = Depends(get_session)):
+    now = datetime.utcnow()
+    token_hash = hash_token(data.refresh_token)
+    # Revoke and read the presented token in one statement; concurrent
+    # rotations of the same token cannot both succeed.
+    rotated = (await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token == token_hash, RefreshToken.revoked_at.is_(None), RefreshToken.expires_at > now)
+        .values(revoked_at=now)
+        .returning(RefreshToken.user_id, RefreshToken.family_id, RefreshToken.created_at, RefreshToken.expires_at)
+    )).first()
+    if not rotated:
+        reused_family = await db.scalar(select(RefreshToken.family_id).where(RefreshToken.token == token_hash, RefreshToken.revoked_at.isnot(None)))
+        if reused_family:
+            # A rotated token came back: assume it was stolen and end the session
+            await db.execute(delete(RefreshToken).where(RefreshToken.family_id == reused_family))
+            await db.commit()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    ttl = rotated.expires_at - rotated.created_at
+    refresh_value = _issue_refresh_token(db, rotated.user_id, now, ttl, family_id=rotated.family_id)
+    await db.commit()
+    return TokenResponse(access_token=create_access_token(rotated.user_id), refresh_token=refresh_value)
+
+
 @app.post("/api/auth/logout")
-def logout(refresh_token: str, db: Session = Depends(get_db)):
-    db.query(RefreshToken).filter(RefreshToken.token == refresh_token).delete()
-    db.commit()
+async def logout(refresh_token: str, authorization: str | None = Header(None), db: AsyncSession = Depends(get_session)):
+    await db.execute(delete(RefreshToken).where(RefreshToken.token == hash_token(refresh_token)))
+    claims = _bearer_claims(authorization)
+    if claims:
+        expires_at = datetime.utcfromtimestamp(claims["exp"])
+        await revoke(db, claims["jti"], expires_at)
+    await db.commit()
+    if claims:
+        revoked_tokens.add(claims["jti"], expires_at)
     return {"message": "Logged out"}
+
+
+@app.get("/internal/auth/verify")
+async def verify_access_token(authorization: str | None = Header(None)):
+    """Validate an access token for other services without touching the database."""
+    claims = _bearer_claims(authorization)
+    if not claims or revoked_tokens.is_revoked(claims["jti"]):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or revoked token")
+    return {"user_id": claims["sub"]}
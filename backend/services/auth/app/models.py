@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime, timedelta
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Integer, CHAR
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Integer, CHAR, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -18,6 +18,10 @@ class User(Base):
     email_token_expires = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_users_email_token", "email_token", "email_token_expires"),
+    )
+
 class SMSCode(Base):
     __tablename__ = 'sms_codes'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -26,15 +30,43 @@ class SMSCode(Base):
     sent_at = Column(DateTime, default=datetime.utcnow)
     attempts = Column(Integer, default=0)
 
+    __table_args__ = (
+        Index("ix_sms_codes_phone_sent_at", "phone", "sent_at"),
+        Index("ix_sms_codes_sent_at", "sent_at"),
+    )
+
 class RefreshToken(Base):
     __tablename__ = 'refresh_tokens'
-    token = Column(CHAR(64), primary_key=True)
+    token = Column(CHAR(64), primary_key=True)  # SHA-256 of the token handed to the client
     user_id = Column(String(36), ForeignKey('users.id', ondelete='CASCADE'))
+    family_id = Column(String(36), nullable=False, default=lambda: str(uuid.uuid4()))  # shared by rotations of one login
     expires_at = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    revoked_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_refresh_tokens_user_id", "user_id"),
+        Index("ix_refresh_tokens_family_id", "family_id"),
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+    )
 
 class PasswordResetToken(Base):
     __tablename__ = 'password_reset_tokens'
     token = Column(String(36), primary_key=True)
     user_id = Column(String(36), ForeignKey('users.id', ondelete='CASCADE'))
     expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_password_reset_tokens_expires_at", "expires_at"),
+    )
+
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String(36), primary_key=True)  # ``jti`` claim of a logged out access token
+    expires_at = Column(DateTime, nullable=False)  # the token's own expiry, after which the row is useless
+    revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_revoked_tokens_revoked_at", "revoked_at"),
+        Index("ix_revoked_tokens_expires_at", "expires_at"),
+    )
@@ -0,0 +1,151 @@
+"""Bulk creation of email users from NDJSON or CSV.
+
+Each row needs ``email`` and ``password``. Rows are processed in batches: one
+query finds already registered emails, passwords are hashed in parallel and
+the new users are written with a single multi-row INSERT per batch. One result
+per input row is produced as soon as its batch is committed. If another
+registration takes one of a batch's emails in the meantime, the batch is
+rolled back and its new users are reported as errors.
+
+From the command line::
+
+    python -m app.provisioning users.csv > results.ndjson
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .models import User
+from .schemas import EmailRegisterRequest
+from .utils import hash_password
+
+
+def parse_rows(text: str, fmt: str) -> Iterator[dict]:
+    if fmt == "csv":
+        yield from csv.DictReader(io.StringIO(text))
+        return
+    for line in text.splitlines():
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            # Any other JSON value is reported as an invalid row, not raised mid-stream
+            yield row if isinstance(row, dict) else {}
+
+
+def batches(rows: Iterable[dict], size: int) -> Iterator[list[tuple[int, dict]]]:
+    batch = []
+    for i, row in enumerate(rows):
+        batch.append((i, row))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def prepare_batch(db: AsyncSession, batch: list[tuple[int, dict]]):
+    """Validate a batch and split it into rejected results and users to create."""
+    results, valid = {}, []
+    for i, row in batch:
+        try:
+            data = EmailRegisterRequest(email=row.get("email"), password=row.get("password"))
+        except ValidationError as exc:
+            results[i] = {"row": i, "email": row.get("email"), "status": "invalid", "error": exc.errors()[0]["msg"]}
+            continue
+        valid.append((i, data))
+
+    emails = [data.email for _, data in valid]
+    taken = set(await db.scalars(select(User.email).where(User.email.in_(emails)))) if emails else set()
+    pending = []
+    for i, data in valid:
+        if data.email in taken:
+            results[i] = {"row": i, "email": data.email, "status": "duplicate"}
+            continue
+        taken.add(data.email)
+        pending.append((i, data))
+    return results, pending
+
+
+async def insert_batch(db: AsyncSession, pending: list, hashes: list[str], results: dict) -> list[dict]:
+    now = datetime.utcnow()
+    users = []
+    for (i, data), password_hash in zip(pending, hashes):
+        user_id = str(uuid.uuid4())
+        users.append({
+            "id": user_id,
+            "login_type": "email",
+            "email": data.email,
+            "password_hash": password_hash,
+            "is_active": True,
+            "created_at": now,
+        })
+        results[i] = {"row": i, "email": data.email, "status": "created", "id": user_id}
+    try:
+        if users:
+            await db.execute(insert(User), users)
+        await db.commit()
+    except IntegrityError:
+        # An email registered since prepare_batch checked; the whole batch is rolled back
+        await db.rollback()
+        for i, data in pending:
+            results[i] = {"row": i, "email": data.email, "status": "error", "error": "conflicts with a concurrent registration"}
+    return [results[i] for i in sorted(results)]
+
+
+async def provision(
+    db: AsyncSession,
+    rows: Iterable[dict],
+    hash_many: Callable[[list[str]], Awaitable[list[str]]],
+    batch_size: int | None = None,
+) -> AsyncIterator[dict]:
+    for batch in batches(rows, batch_size or settings.provision_batch_size):
+        results, pending = await prepare_batch(db, batch)
+        hashes = await hash_many([data.password for _, data in pending]) if pending else []
+        for result in await insert_batch(db, pending, hashes, results):
+            yield result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create email users in bulk")
+    parser.add_argument("path", help="NDJSON or CSV file with email and password columns")
+    parser.add_argument("--format", choices=("ndjson", "csv"))
+    parser.add_argument("--batch-size", type=int, default=settings.provision_batch_size)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    with open(args.path, encoding="utf-8") as f:
+        rows = parse_rows(f.read(), fmt)
+    asyncio.run(_provision_file(rows, args.batch_size, args.workers))
+
+
+async def _provision_file(rows: Iterable[dict], batch_size: int, workers: int):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        async def hash_many(passwords):
+            chunk = max(1, len(passwords) // (workers * 4))
+            return await asyncio.to_thread(lambda: list(executor.map(hash_password, passwords, chunksize=chunk)))
+
+        async with AsyncSessionLocal() as db:
+            async for result in provision(db, rows, hash_many, batch_size):
+                sys.stdout.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
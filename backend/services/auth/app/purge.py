@@ -0,0 +1,77 @@
+"""Delete expired SMS codes, refresh tokens, password reset tokens and revocations.
+
+Rows are removed in chunks of ``chunk_size`` with a commit after each chunk so
+no single statement holds locks for long. Run once from the command line::
+
+    python -m app.purge --chunk-size 5000
+
+or let the service run it every ``AUTH_PURGE_INTERVAL`` seconds.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .models import SMSCode, RefreshToken, PasswordResetToken, RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+def _targets(now: datetime):
+    return (
+        ("sms_codes", SMSCode, SMSCode.id, SMSCode.sent_at < now - timedelta(seconds=settings.sms_code_ttl)),
+        ("refresh_tokens", RefreshToken, RefreshToken.token, RefreshToken.expires_at < now),
+        ("password_reset_tokens", PasswordResetToken, PasswordResetToken.token, PasswordResetToken.expires_at < now),
+        ("revoked_tokens", RevokedToken, RevokedToken.jti, RevokedToken.expires_at < now),
+    )
+
+
+async def purge_table(db: AsyncSession, model, pk, condition, chunk_size: int) -> int:
+    total = 0
+    while True:
+        chunk = select(pk).where(condition).limit(chunk_size)
+        result = await db.execute(delete(model).where(pk.in_(chunk)).execution_options(synchronize_session=False))
+        await db.commit()
+        total += result.rowcount
+        if result.rowcount < chunk_size:
+            return total
+
+
+async def purge_expired(db: AsyncSession, chunk_size: int | None = None, now: datetime | None = None) -> dict[str, int]:
+    """Purge every expired row and return the number removed per table."""
+    chunk_size = chunk_size or settings.purge_chunk_size
+    now = now or datetime.utcnow()
+    return {name: await purge_table(db, model, pk, condition, chunk_size) for name, model, pk, condition in _targets(now)}
+
+
+async def run_once(chunk_size: int | None = None) -> dict[str, int]:
+    async with AsyncSessionLocal() as db:
+        removed = await purge_expired(db, chunk_size)
+    logger.info("purged expired rows: %s", removed)
+    return removed
+
+
+async def run_periodically(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_once()
+        except Exception:
+            logger.exception("purge of expired rows failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete expired auth rows")
+    parser.add_argument("--chunk-size", type=int, default=settings.purge_chunk_size)
+    args = parser.parse_args()
+    for table, count in asyncio.run(run_once(args.chunk_size)).items():
+        print(f"{table}: {count} rows removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+from .config import settings
+
+
+class MemoryBackend:
+    """Sliding-window log kept in process memory (per worker)."""
+
+    SWEEP_EVERY = 4096
+
+    def __init__(self):
+        self._hits: dict[str, tuple[deque, int]] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    async def hit(self, key: str, limit: int, window: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            if self._calls % self.SWEEP_EVERY == 0:
+                self._sweep(now)
+            hits, _ = self._hits.setdefault(key, (deque(), window))
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return False
+            hits.append(now)
+            return True
+
+    def _sweep(self, now: float):
+        stale = [key for key, (hits, window) in self._hits.items() if not hits or hits[-1] <= now - window]
+        for key in stale:
+            del self._hits[key]
+
+    async def clear(self):
+        with self._lock:
+            self._hits.clear()
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    """Sliding-window log stored in Redis sorted sets, shared by all workers.
+
+    Works against any server speaking the Redis protocol. Uses the asyncio
+    client, so a round trip never blocks the event loop.
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio
+
+        # RESP2 is understood by every server; newer clients default to RESP3 (HELLO 3)
+        self._client = redis.asyncio.Redis.from_url(url, protocol=2)
+
+    async def hit(self, key: str, limit: int, window: int) -> bool:
+        now = time.time()
+        member = f"{now}:{uuid.uuid4().hex}"
+        key = f"ratelimit:{key}"
+        async with self._client.pipeline() as pipe:
+            pipe.zremrangebyscore(key, 0, now - window)
+            pipe.zadd(key, {member: now})
+            pipe.zcard(key)
+            pipe.expire(key, window)
+            _, _, count, _ = await pipe.execute()
+        if count > limit:
+            # Rejected hits do not count against the window
+            await self._client.zrem(key, member)
+            return False
+        return True
+
+    async def clear(self):
+        async for key in self._client.scan_iter("ratelimit:*"):
+            await self._client.delete(key)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def create_backend(url: str):
+    if url:
+        return RedisBackend(url)
+    return MemoryBackend()
+
+
+class RateLimiter:
+    """Allows ``limit`` hits per ``window`` seconds for each key."""
+
+    def __init__(self, backend, name: str, limit: int, window: int):
+        self.backend = backend
+        self.name = name
+        self.limit = limit
+        self.window = window
+
+    async def allow(self, key: str) -> bool:
+        return await self.backend.hit(f"{self.name}:{key}", self.limit, self.window)
+
+
+backend = create_backend(settings.rate_limit_url)
+send_code_by_phone = RateLimiter(backend, "send-code:phone", 1, settings.send_code_interval)
+verify_by_phone = RateLimiter(backend, "verify:phone", settings.verify_attempts_per_phone, 300)
+requests_by_ip = RateLimiter(backend, "ip", settings.requests_per_ip_per_minute, 60)
@@ -0,0 +1,91 @@
+"""Revocation list for access tokens.
+
+Logout stores the access token's ``jti`` in ``revoked_tokens`` together with
+the token's own expiry. Each worker mirrors the live rows into memory so that
+checking a token is a dict lookup, and pulls rows revoked since its last sync
+every ``AUTH_REVOCATION_SYNC_INTERVAL`` seconds, so a logout handled by one
+worker takes effect on the others within that interval.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# Each sync re-reads rows this far behind the newest one seen, so a row
+# committed late by another worker, or stamped by a clock running behind,
+# is still picked up
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class RevocationList:
+    """In-memory set of revoked ``jti`` values, each dropped once its token expires."""
+
+    def __init__(self):
+        self._expires: dict[str, datetime] = {}
+        self._synced_until: datetime | None = None
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def add(self, jti: str, expires_at: datetime):
+        self._expires[jti] = expires_at
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._expires
+
+    def clear(self):
+        self._expires.clear()
+        self._synced_until = None
+
+    async def sync(self, db: AsyncSession, now: datetime | None = None) -> int:
+        """Load rows revoked since the last sync and forget expired ones; returns rows read."""
+        now = now or datetime.utcnow()
+        query = select(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at)
+        if self._synced_until is None:
+            query = query.where(RevokedToken.expires_at > now)
+        else:
+            query = query.where(RevokedToken.revoked_at > self._synced_until - SYNC_OVERLAP)
+        rows = (await db.execute(query)).all()
+
+        synced_until = self._synced_until or now
+        for jti, expires_at, revoked_at in rows:
+            self._expires[jti] = expires_at
+            synced_until = max(synced_until, revoked_at)
+        self._synced_until = synced_until
+        self._expires = {jti: expires_at for jti, expires_at in self._expires.items() if expires_at > now}
+        return len(rows)
+
+
+revoked_tokens = RevocationList()
+
+
+async def revoke(db: AsyncSession, jti: str, expires_at: datetime):
+    """Add ``jti`` to the revocation table; revoking the same token twice is a no-op.
+
+    The caller commits, then records the token in ``revoked_tokens``.
+    """
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    await db.execute(insert(RevokedToken).values(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow()).on_conflict_do_nothing())
+
+
+async def sync_once():
+    async with AsyncSessionLocal() as db:
+        await revoked_tokens.sync(db)
+
+
+async def run_periodically(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sync_once()
+        except Exception:
+            logger.exception("revocation list sync failed")
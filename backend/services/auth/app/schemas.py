@@ -27,6 +27,9 @@ class ResetPasswordRequest(BaseModel):
     token: str
     new_password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class TokenResponse(BaseModel):
     access_token: str
     refresh_token: str
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import uuid
 from datetime import datetime, timedelta
@@ -6,21 +7,40 @@ import jwt
 from .config import settings
 
 
-def hash_password(password: str) -> str:
-    return bcrypt.hash(password)
+def hash_password(password: str, rounds: int | None = None) -> str:
+    return bcrypt.using(rounds=rounds or settings.bcrypt_rounds).hash(password)
 
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.verify(password, hashed)
 
 
+def hash_rounds(hashed: str) -> int:
+    return int(hashed.split("$")[2])
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True when ``hashed`` was made with a cost other than the configured one."""
+    return hash_rounds(hashed) != settings.bcrypt_rounds
+
+
 def create_access_token(user_id: str) -> str:
     payload = {
         "sub": user_id,
         "exp": datetime.utcnow() + timedelta(seconds=settings.access_token_ttl),
+        "jti": str(uuid.uuid4()),
     }
     return jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
 
 
+def decode_access_token(token: str) -> dict:
+    """Return the claims of a valid access token; raises ``jwt.InvalidTokenError``."""
+    return jwt.decode(token, settings.jwt_secret, algorithms=["HS256"], options={"require": ["exp", "sub", "jti"]})
+
+
 def create_refresh_token() -> str:
     return uuid.uuid4().hex + uuid.uuid4().hex
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
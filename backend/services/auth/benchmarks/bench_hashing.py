@@ -0,0 +1,53 @@
+"""Measure login (bcrypt verify) throughput for hashing pools of growing size.
+
+Run from ``backend/``::
+
+    python services/auth/benchmarks/bench_hashing.py --logins 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.auth.app.hashing import HashingPool
+from services.auth.app.utils import hash_password, verify_password
+
+
+async def _run(workers: int, logins: int, hashed: str) -> float:
+    pool = HashingPool(workers, max_pending=logins)
+    # warm up so process start-up is not counted
+    await asyncio.gather(*(pool.run(verify_password, "secret", hashed) for _ in range(workers)))
+    start = time.perf_counter()
+    await asyncio.gather(*(pool.run(verify_password, "secret", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    hashed = hash_password("secret")
+    start = time.perf_counter()
+    for _ in range(min(args.logins, 8)):
+        verify_password("secret", hashed)
+    inline = min(args.logins, 8) / (time.perf_counter() - start)
+    print(f"inline      {inline:8.1f} logins/s")
+
+    workers = 1
+    while workers <= args.max_workers:
+        rate = asyncio.run(_run(workers, args.logins, hashed))
+        print(f"workers={workers:<3} {rate:8.1f} logins/s")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
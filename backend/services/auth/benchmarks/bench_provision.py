@@ -0,0 +1,66 @@
+"""Time bulk user provisioning for 10k and 100k users against SQLite.
+
+Run from ``backend/``::
+
+    python services/auth/benchmarks/bench_provision.py --rows 10000 100000 --hash none
+
+``--hash none`` skips bcrypt to measure the duplicate check and batched
+inserts alone; ``--hash bcrypt`` hashes across all cores like the CLI does.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.auth.app.database import Base
+from services.auth.app.provisioning import provision
+from services.auth.app.utils import hash_password
+
+
+async def _provision(path: str, count: int, hash_many, batch_size: int) -> int:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    rows = ({"email": f"user{i}@example.com", "password": "secret"} for i in range(count))
+    created = 0
+    async with AsyncSession(engine) as db:
+        async for result in provision(db, rows, hash_many, batch_size):
+            created += result["status"] == "created"
+    await engine.dispose()
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--hash", choices=("bcrypt", "none"), default="none")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        async def hash_many(passwords):
+            if args.hash == "none":
+                return passwords
+            chunk = max(1, len(passwords) // (workers * 4))
+            return await asyncio.to_thread(lambda: list(executor.map(hash_password, passwords, chunksize=chunk)))
+
+        for count in args.rows:
+            path = os.path.join(tempfile.mkdtemp(), "bulk.db")
+            Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+            start = time.perf_counter()
+            created = asyncio.run(_provision(path, count, hash_many, args.batch_size))
+            elapsed = time.perf_counter() - start
+            print(f"{count:>7} rows  created={created}  {elapsed:7.2f}s  {count / elapsed:9.0f} users/s  hash={args.hash}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Seed expired refresh tokens in SQLite and time the chunked purge.
+
+Run from ``backend/``::
+
+    python services/auth/benchmarks/bench_purge.py --rows 2000000 --chunk-size 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.auth.app.database import Base
+from services.auth.app.models import RefreshToken
+from services.auth.app.purge import purge_expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "purge.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    for offset in range(0, args.rows, 100_000):
+        db.execute(insert(RefreshToken), [
+            {"token": uuid.uuid4().hex * 2, "expires_at": now + timedelta(days=-1 if i % 2 else 1)}
+            for i in range(offset, min(offset + 100_000, args.rows))
+        ])
+        db.commit()
+    print(f"seeded {args.rows} rows in {time.perf_counter() - start:.1f}s")
+    db.close()
+
+    chunk_times = []
+    last = [time.perf_counter()]
+
+    def on_commit(conn):
+        now_ = time.perf_counter()
+        chunk_times.append(now_ - last[0])
+        last[0] = now_
+
+    async def purge():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        event.listen(async_engine.sync_engine, "commit", on_commit)
+        async with AsyncSession(async_engine) as session:
+            result = await purge_expired(session, chunk_size=args.chunk_size, now=now)
+        await async_engine.dispose()
+        return result
+
+    start = last[0] = time.perf_counter()
+    removed = asyncio.run(purge())
+    elapsed = time.perf_counter() - start
+    total = sum(removed.values())
+    print(f"removed {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)")
+    print(f"chunks={len(chunk_times)} slowest chunk={max(chunk_times) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+import asyncio
+import inspect
+import ipaddress
+import json
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# Add repository root to the path so ``services`` can be imported as a package
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+DB_PATH = "auth_test.db"
+if os.path.exists(DB_PATH):
+    os.remove(DB_PATH)
+os.environ.setdefault("AUTH_DATABASE_URL", f"sqlite:///{DB_PATH}")
+os.environ.setdefault("AUTH_BCRYPT_ROUNDS", "4")
+os.environ.setdefault("AUTH_PROVISION_TOKEN", "provision-secret")
+
+from services.auth.app.main import app
+from services.auth.app.hashing import HashingBusy, hashing_pool
+from services.auth.app.config import settings
+from services.auth.app.utils import decode_access_token, hash_password, hash_rounds
+from services.auth.app.database import engine, AsyncSessionLocal, init_db
+from services.auth.app.revocation import RevocationList, revoked_tokens
+from services.auth.app.models import User, SMSCode, RefreshToken, PasswordResetToken
+from services.auth.app import provisioning
+
+asyncio.run(init_db())
+client = TestClient(app)
+# Test lookups use a separate sync engine so they are not counted
+SessionLocal = sessionmaker(bind=create_engine(settings.database_url))
+SERVICE_TOKEN = {"X-Service-Token": settings.provision_token}
+
+
+def _email():
+    return f"{uuid.uuid4().hex[:12]}@example.com"
+
+
+def _phone():
+    return f"+7{uuid.uuid4().int % 10**10:010d}"
+
+
+@contextmanager
+def count_statements():
+    counts = {"queries": 0, "commits": 0}
+
+    def on_execute(*args):
+        counts["queries"] += 1
+
+    def on_commit(conn):
+        counts["commits"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    event.listen(engine.sync_engine, "commit", on_commit)
+    try:
+        yield counts
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+        event.remove(engine.sync_engine, "commit", on_commit)
+
+
+def _last_code(phone):
+    db = SessionLocal()
+    try:
+        return db.query(SMSCode).filter(SMSCode.phone == phone).order_by(SMSCode.sent_at.desc()).first().code
+    finally:
+        db.close()
+
+
+def test_register_and_login():
+    email = _email()
+    resp = client.post("/api/auth/email/register", json={"email": email, "password": "secret"})
+    assert resp.status_code == 200
+
+    resp = client.post("/api/auth/email/login", json={"email": email, "password": "secret"})
+    assert resp.status_code == 200
+    assert resp.json()["user"]["email"] == email
+
+    resp = client.post("/api/auth/email/login", json={"email": email, "password": "wrong"})
+    assert resp.status_code == 401
+
+
+def test_async_handlers_never_take_a_sync_session():
+    # A sync Session inside ``async def`` would block the event loop on every query
+    from fastapi.routing import APIRoute
+    from sqlalchemy.orm import Session
+
+    def dependencies(dependant):
+        for sub in dependant.dependencies:
+            yield sub
+            yield from dependencies(sub)
+
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or not inspect.iscoroutinefunction(route.endpoint):
+            continue
+        for param in inspect.signature(route.endpoint).parameters.values():
+            assert param.annotation is not Session, route.path
+        for sub in dependencies(route.dependant):
+            assert not inspect.isgeneratorfunction(sub.call), (route.path, sub.call)
+
+
+def test_login_rejected_when_hash_pool_saturated():
+    email = _email()
+    client.post("/api/auth/email/register", json={"email": email, "password": "secret"})
+    in_flight = hashing_pool.in_flight
+    hashing_pool.in_flight = hashing_pool.limit
+    try:
+        resp = client.post("/api/auth/email/login", json={"email": email, "password": "secret"})
+    finally:
+        hashing_pool.in_flight = in_flight
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"]
+
+
+def test_verify_phone_registers_in_one_commit():
+    phone = _phone()
+    with count_statements() as counts:
+        assert client.post("/api/auth/phone/send-code", json={"phone": phone}).status_code == 200
+    assert counts["commits"] == 1
+
+    code = _last_code(phone)
+    payload = {"phone": phone, "code": code, "email": _email(), "password": "secret"}
+    with count_statements() as counts:
+        resp = client.post("/api/auth/phone/verify", json=payload)
+    assert resp.status_code == 200
+    assert counts["commits"] == 1
+    assert counts["queries"] <= 4
+
+    with count_statements() as counts:
+        resp = client.post("/api/auth/phone/verify", json={"phone": phone, "code": code})
+    assert resp.status_code == 200
+    assert counts["commits"] == 1
+
+
+def test_verify_phone_failed_attempt_commits_once():
+    phone = _phone()
+    client.post("/api/auth/phone/send-code", json={"phone": phone})
+    wrong = "000000" if _last_code(phone) != "000000" else "111111"
+    with count_statements() as counts:
+        resp = client.post("/api/auth/phone/verify", json={"phone": phone, "code": wrong})
+    assert resp.status_code == 401
+    assert counts["commits"] == 1
+
+
+def test_email_flows_commit_once():
+    email = _email()
+    with count_statements() as counts:
+        client.post("/api/auth/email/register", json={"email": email, "password": "secret"})
+    assert counts["commits"] == 1
+
+    db = SessionLocal()
+    token = db.query(User).filter(User.email == email).first().email_token
+    db.close()
+    with count_statements() as counts:
+        assert client.get(f"/api/auth/email/confirm?token={token}").status_code == 200
+    assert counts["commits"] == 1
+
+    with count_statements() as counts:
+        resp = client.post("/api/auth/email/login", json={"email": email, "password": "secret"})
+    assert resp.status_code == 200
+    assert counts["commits"] == 1
+    assert counts["queries"] == 2
+
+    with count_statements() as counts:
+        client.post("/api/auth/email/forgot", json={"email": email})
+    assert counts["commits"] == 1
+
+    db = SessionLocal()
+    reset_token = db.query(PasswordResetToken).join(User, User.id == PasswordResetToken.user_id).filter(User.email == email).one().token
+    db.close()
+    with count_statements() as counts:
+        resp = client.post("/api/auth/email/reset", json={"token": reset_token, "new_password": "secret2"})
+    assert resp.status_code == 200
+    assert counts["commits"] == 1
+    assert counts["queries"] == 4
+
+
+def test_send_code_rate_limited_before_db_access():
+    phone = _phone()
+    assert client.post("/api/auth/phone/send-code", json={"phone": phone}).status_code == 200
+    with count_statements() as counts:
+        resp = client.post("/api/auth/phone/send-code", json={"phone": phone})
+    assert resp.status_code == 429
+    assert counts["queries"] == 0
+
+
+def test_memory_rate_limiter_window(monkeypatch):
+    from services.auth.app import ratelimit
+
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    limiter = ratelimit.RateLimiter(ratelimit.MemoryBackend(), "test", 2, 10)
+    assert asyncio.run(limiter.allow("a"))
+    assert asyncio.run(limiter.allow("a"))
+    assert not asyncio.run(limiter.allow("a"))
+    assert asyncio.run(limiter.allow("b"))
+    now[0] += 10
+    assert asyncio.run(limiter.allow("a"))
+
+
+def test_client_ip_taken_from_forwarded_for_only_behind_trusted_proxies(monkeypatch):
+    from starlette.requests import Request
+    from services.auth.app import main
+
+    def client_ip(peer, forwarded=None):
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        return main._client_ip(Request({"type": "http", "client": (peer, 40000), "headers": headers}))
+
+    monkeypatch.setattr(main, "TRUSTED_PROXIES", [ipaddress.ip_network("172.28.0.0/16")])
+    assert client_ip("203.0.113.9", "198.51.100.1") == "203.0.113.9"
+    assert client_ip("172.28.0.10", "198.51.100.1") == "198.51.100.1"
+    # A client-supplied hop left of the one the proxy appended is ignored
+    assert client_ip("172.28.0.10", "10.0.0.1, 198.51.100.1") == "198.51.100.1"
+    assert client_ip("172.28.0.10", "198.51.100.1, 172.28.0.11") == "198.51.100.1"
+    assert client_ip("172.28.0.10") == "172.28.0.10"
+
+
+def test_refresh_rotates_tokens_and_detects_reuse():
+    email = _email()
+    client.post("/api/auth/email/register", json={"email": email, "password": "secret"})
+    first = client.post("/api/auth/email/login", json={"email": email, "password": "secret"}).json()["refresh_token"]
+
+    with count_statements() as counts:
+        resp = client.post("/api/auth/refresh", json={"refresh_token": first})
+    assert resp.status_code == 200
+    assert counts["commits"] == 1
+    assert counts["queries"] == 2  # rotate + insert, no users lookup
+    second = resp.json()["refresh_token"]
+    assert second != first
+
+    db = SessionLocal()
+    assert db.query(RefreshToken).filter(RefreshToken.token == first).first() is None  # stored hashed
+    db.close()
+
+    assert client.post("/api/auth/refresh", json={"refresh_token": first}).status_code == 401
+    # reuse of a rotated token revokes the whole family
+    assert client.post("/api/auth/refresh", json={"refresh_token": second}).status_code == 401
+
+
+def test_logout_revokes_access_token_without_db_lookups():
+    email = _email()
+    client.post("/api/auth/email/register", json={"email": email, "password": "secret"})
+    tokens = client.post("/api/auth/email/login", json={"email": email, "password": "secret"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    with count_statements() as counts:
+        resp = client.get("/internal/auth/verify", headers=headers)
+    assert resp.status_code == 200
+    assert counts["queries"] == 0
+
+    with count_statements() as counts:
+        assert client.post(f"/api/auth/logout?refresh_token={tokens['refresh_token']}", headers=headers).status_code == 200
+    assert counts["commits"] == 1
+    assert client.get("/internal/auth/verify", headers=headers).status_code == 401
+    # logging out twice with the same token is harmless
+    assert client.post(f"/api/auth/logout?refresh_token={tokens['refresh_token']}", headers=headers).status_code == 200
+
+    # another worker learns about the revocation on its next sync
+    other_worker = RevocationList()
+
+    async def sync():
+        async with AsyncSessionLocal() as db:
+            return await other_worker.sync(db)
+
+    assert asyncio.run(sync()) >= 1
+    jti = decode_access_token(tokens["access_token"])["jti"]
+    assert revoked_tokens.is_revoked(jti)
+    assert other_worker.is_revoked(jti)
+    assert asyncio.run(sync()) >= 1  # overlap window re-reads recent rows
+
+
+def test_bulk_provision_streams_per_row_results():
+    existing = _email()
+    client.post("/api/auth/email/register", json={"email": existing, "password": "secret"})
+    new = [_email(), _email()]
+    body = "\n".join([
+        f'{{"email": "{new[0]}", "password": "a"}}',
+        f'{{"email": "{existing}", "password": "b"}}',
+        f'{{"email": "{new[1]}", "password": "c"}}',
+        f'{{"email": "{new[0]}", "password": "d"}}',
+        '{"email": "not-an-email", "password": "e"}',
+        '[1, 2]',
+        '"x"',
+    ])
+    with count_statements() as counts:
+        resp = client.post("/internal/auth/users/bulk", content=body, headers={"Content-Type": "application/x-ndjson", **SERVICE_TOKEN})
+    assert resp.status_code == 200
+    results = [json.loads(line) for line in resp.text.splitlines()]
+    assert [r["status"] for r in results] == ["created", "duplicate", "created", "duplicate", "invalid", "invalid", "invalid"]
+    assert counts["commits"] == 1
+    assert counts["queries"] == 2  # duplicate check + one multi-row insert
+
+    csv_email = _email()
+    resp = client.post("/internal/auth/users/bulk", content=f"email,password\n{csv_email},secret\n", headers={"Content-Type": "text/csv", **SERVICE_TOKEN})
+    assert json.loads(resp.text)["status"] == "created"
+    resp = client.post("/api/auth/email/login", json={"email": csv_email, "password": "secret"})
+    assert resp.status_code == 200
+
+
+def test_bulk_provision_requires_service_token():
+    body = f'{{"email": "{_email()}", "password": "secret"}}'
+    assert client.post("/internal/auth/users/bulk", content=body).status_code == 403
+    assert client.post("/internal/auth/users/bulk", content=body, headers={"X-Service-Token": "wrong"}).status_code == 403
+
+
+def test_bulk_provision_reports_concurrent_registration_as_errors(monkeypatch):
+    racing, other = _email(), _email()
+    prepare_batch = provisioning.prepare_batch
+
+    async def register_meanwhile(db, batch):
+        prepared = await prepare_batch(db, batch)
+        if batch[0][1]["email"] == racing:
+            client.post("/api/auth/email/register", json={"email": racing, "password": "secret"})
+        return prepared
+
+    monkeypatch.setattr(provisioning, "prepare_batch", register_meanwhile)
+    monkeypatch.setattr(settings, "provision_batch_size", 2)
+    body = "\n".join(f'{{"email": "{email}", "password": "secret"}}' for email in (racing, _email(), other))
+    resp = client.post("/internal/auth/users/bulk", content=body, headers=SERVICE_TOKEN)
+    assert resp.status_code == 200
+    results = [json.loads(line) for line in resp.text.splitlines()]
+    # The first batch is rolled back whole; the stream goes on with the next one
+    assert [r["status"] for r in results] == ["error", "error", "created"]
+    assert results[2]["email"] == other
+
+
+def test_hash_batch_admitted_whole_or_not_at_all():
+    in_flight = hashing_pool.in_flight
+    hashing_pool.in_flight = hashing_pool.limit - 1
+    try:
+        with pytest.raises(HashingBusy):
+            asyncio.run(hashing_pool.map(hash_password, ["a", "b"], [4, 4]))
+        # Nothing was admitted, so no job is left running for the retry to duplicate
+        assert hashing_pool.in_flight == hashing_pool.limit - 1
+    finally:
+        hashing_pool.in_flight = in_flight
+    assert len(asyncio.run(hashing_pool.map(hash_password, ["a", "b"], [4, 4]))) == 2
+    assert hashing_pool.in_flight == in_flight
+
+
+def test_login_rehashes_password_with_configured_cost(monkeypatch):
+    email = _email()
+    client.post("/internal/auth/users/bulk", content=f'{{"email": "{email}", "password": "secret"}}', headers=SERVICE_TOKEN)
+    monkeypatch.setattr(settings, "bcrypt_rounds", 5)
+
+    resp = client.post("/api/auth/email/login", json={"email": email, "password": "secret"})
+    assert resp.status_code == 200
+    db = SessionLocal()
+    stored = db.query(User).filter(User.email == email).first().password_hash
+    db.close()
+    assert hash_rounds(stored) == 5
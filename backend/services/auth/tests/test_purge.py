@@ -0,0 +1,60 @@
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add repository root to the path so ``services`` can be imported as a package
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.auth.app.database import Base
+from services.auth.app.models import SMSCode, RefreshToken, PasswordResetToken
+from services.auth.app.purge import purge_expired
+
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'purge.db'}")
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+async def _purge(tmp_path, **kwargs):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'purge.db'}")
+    commits = []
+    event.listen(engine.sync_engine, "commit", lambda conn: commits.append(1))
+    async with AsyncSession(engine) as db:
+        removed = await purge_expired(db, **kwargs)
+    await engine.dispose()
+    return removed, commits
+
+
+def test_purge_removes_only_expired_rows_in_chunks(tmp_path):
+    engine, db = _session(tmp_path)
+    now = datetime.utcnow()
+    rows = 20000
+    db.execute(insert(RefreshToken), [
+        {"token": uuid.uuid4().hex * 2, "user_id": None, "expires_at": now + timedelta(days=-1 if i % 2 else 1)}
+        for i in range(rows)
+    ])
+    db.execute(insert(SMSCode), [
+        {"phone": "+70000000000", "code": "123456", "sent_at": now - timedelta(minutes=10 if i % 2 else 1)}
+        for i in range(rows)
+    ])
+    db.execute(insert(PasswordResetToken), [
+        {"token": str(uuid.uuid4()), "user_id": None, "expires_at": now - timedelta(minutes=1)}
+    ])
+    db.commit()
+
+    removed, commits = asyncio.run(_purge(tmp_path, chunk_size=1000, now=now))
+
+    assert removed == {"sms_codes": rows // 2, "refresh_tokens": rows // 2, "password_reset_tokens": 1, "revoked_tokens": 0}
+    # one commit per full chunk plus the final partial one for each table
+    assert len(commits) == (rows // 2 // 1000 + 1) * 2 + 2
+    assert db.scalar(select(func.count()).select_from(RefreshToken)) == rows // 2
+    assert db.scalar(select(func.count()).select_from(SMSCode)) == rows // 2
+    db.close()
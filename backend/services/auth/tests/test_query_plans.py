@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# Add repository root to the path so ``services`` can be imported as a package
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+os.environ.setdefault("AUTH_DATABASE_URL", "sqlite:///auth_test.db")
+os.environ.setdefault("AUTH_PROVISION_TOKEN", "provision-secret")
+
+from services.auth.app.main import app
+from services.auth.app.config import settings
+from services.auth.app.database import engine, AsyncSessionLocal, init_db
+from services.auth.app.models import User, SMSCode, PasswordResetToken
+from services.auth.app.purge import purge_expired
+from services.auth.app.revocation import RevocationList
+from services.auth.app import ratelimit
+
+asyncio.run(init_db())
+client = TestClient(app)
+# Test lookups and EXPLAIN go through a sync engine so they are not captured
+sync_engine = create_engine(settings.database_url)
+Reader = sessionmaker(bind=sync_engine)
+
+
+@contextmanager
+def capture_statements():
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+
+
+def _bad_plan_steps(statement, parameters):
+    """Return plan steps that scan a whole table or sort without an index."""
+    with sync_engine.connect() as conn:
+        plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return [row[-1] for row in plan if row[-1].startswith("SCAN ") or "TEMP B-TREE" in row[-1]]
+
+
+def _run_all_flows():
+    asyncio.run(ratelimit.backend.clear())
+    phone = f"+7{uuid.uuid4().int % 10**10:010d}"
+    email = f"{uuid.uuid4().hex[:12]}@example.com"
+
+    client.post("/api/auth/phone/send-code", json={"phone": phone})
+    db = Reader()
+    code = db.query(SMSCode).filter(SMSCode.phone == phone).first().code
+    db.close()
+    wrong = "000000" if code != "000000" else "111111"
+    client.post("/api/auth/phone/verify", json={"phone": phone, "code": wrong})
+    client.post("/api/auth/phone/verify", json={"phone": phone, "code": code, "email": f"p{email}", "password": "secret"})
+    refresh = client.post("/api/auth/phone/verify", json={"phone": phone, "code": code}).json()["refresh_token"]
+    client.post(f"/api/auth/logout?refresh_token={refresh}")
+
+    client.post("/api/auth/email/register", json={"email": email, "password": "secret"})
+    db = Reader()
+    token = db.query(User).filter(User.email == email).first().email_token
+    db.close()
+    client.get(f"/api/auth/email/confirm?token={token}")
+    tokens = client.post("/api/auth/email/login", json={"email": email, "password": "secret"}).json()
+    refresh = tokens["refresh_token"]
+    client.post("/api/auth/refresh", json={"refresh_token": refresh})
+    client.post("/api/auth/refresh", json={"refresh_token": refresh})
+    client.post("/api/auth/email/forgot", json={"email": email})
+    db = Reader()
+    reset_token = db.query(PasswordResetToken).join(User, User.id == PasswordResetToken.user_id).filter(User.email == email).one().token
+    db.close()
+    client.post("/api/auth/email/reset", json={"token": reset_token, "new_password": "secret2"})
+
+    client.post("/api/auth/logout?refresh_token=x", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+
+    client.post("/internal/auth/users/bulk", content=f'{{"email": "b{email}", "password": "x"}}', headers={"X-Service-Token": settings.provision_token})
+
+    async def purge():
+        async with AsyncSessionLocal() as db:
+            await purge_expired(db)
+            # initial load, then an incremental sync
+            worker = RevocationList()
+            await worker.sync(db)
+            await worker.sync(db)
+
+    asyncio.run(purge())
+
+
+def test_no_query_scans_a_full_table():
+    with capture_statements() as statements:
+        _run_all_flows()
+    assert len(statements) > 10
+
+    failures = {}
+    for statement, parameters in statements:
+        steps = _bad_plan_steps(statement, parameters)
+        if steps:
+            failures[statement] = steps
+    assert not failures, failures
@@ -0,0 +1,129 @@
+import asyncio
+import fnmatch
+import sys
+from pathlib import Path
+
+# Add repository root to the path so ``services`` can be imported as a package
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.auth.app import ratelimit
+
+
+class StandInRedis:
+    """Just enough of a RESP2 server for ``RedisBackend``: sorted sets, MULTI/EXEC and SCAN."""
+
+    def __init__(self):
+        self.data: dict[bytes, dict[bytes, float]] = {}
+        self.commands: list[str] = []
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queued = None
+        while True:
+            command = await self._read_command(reader)
+            if command is None:
+                break
+            name = command[0].decode().upper()
+            self.commands.append(name)
+            if name == "MULTI":
+                queued = []
+                writer.write(b"+OK\r\n")
+            elif name == "EXEC":
+                writer.write(b"*%d\r\n" % len(queued) + b"".join(self._encode(self._run(c)) for c in queued))
+                queued = None
+            elif queued is not None:
+                queued.append(command)
+                writer.write(b"+QUEUED\r\n")
+            else:
+                writer.write(self._encode(self._run(command)))
+            await writer.drain()
+        writer.close()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> list[bytes] | None:
+        header = await reader.readline()
+        if not header:
+            return None
+        parts = []
+        for _ in range(int(header[1:])):
+            size = int((await reader.readline())[1:])
+            parts.append((await reader.readexactly(size + 2))[:-2])
+        return parts
+
+    def _run(self, command: list[bytes]):
+        name, args = command[0].decode().upper(), command[1:]
+        if name in ("CLIENT", "SELECT", "PING"):
+            return "OK"
+        if name == "ZREMRANGEBYSCORE":
+            members = self.data.get(args[0], {})
+            low, high = float(args[1]), float(args[2])
+            removed = [m for m, score in members.items() if low <= score <= high]
+            for member in removed:
+                del members[member]
+            return len(removed)
+        if name == "ZADD":
+            members = self.data.setdefault(args[0], {})
+            added = 0
+            for score, member in zip(args[1::2], args[2::2]):
+                added += member not in members
+                members[member] = float(score)
+            return added
+        if name == "ZCARD":
+            return len(self.data.get(args[0], {}))
+        if name == "ZREM":
+            members = self.data.get(args[0], {})
+            return sum(members.pop(member, None) is not None for member in args[1:])
+        if name == "EXPIRE":
+            return int(args[0] in self.data)
+        if name == "SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+            return [b"0", [key for key in self.data if fnmatch.fnmatchcase(key.decode(), pattern)]]
+        if name == "DEL":
+            return sum(self.data.pop(key, None) is not None for key in args)
+        return Exception(f"ERR unknown command '{name}'")
+
+    def _encode(self, value) -> bytes:
+        if isinstance(value, Exception):
+            return b"-%s\r\n" % str(value).encode()
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"*%d\r\n" % len(value) + b"".join(self._encode(item) for item in value)
+
+
+def test_redis_backend_against_stand_in_server(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    stand_in = StandInRedis()
+
+    async def scenario():
+        server = await asyncio.start_server(stand_in.serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        backend = ratelimit.RedisBackend(f"redis://127.0.0.1:{port}/0")
+        limiter = ratelimit.RateLimiter(backend, "test", 2, 10)
+        try:
+            assert await limiter.allow("a")
+            now[0] += 1
+            assert await limiter.allow("a")
+            now[0] += 1
+            assert not await limiter.allow("a")
+            # The rejected hit was removed again, so it does not extend the window
+            assert len(stand_in.data[b"ratelimit:test:a"]) == 2
+            assert stand_in.commands.count("ZREM") == 1
+            assert await limiter.allow("b")
+
+            now[0] += 8.5
+            assert await limiter.allow("a")  # the first hit left the window
+            assert not await limiter.allow("a")
+
+            await backend.clear()
+            assert stand_in.data == {}
+            assert await limiter.allow("a")
+        finally:
+            await backend.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
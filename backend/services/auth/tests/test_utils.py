@@ -9,7 +9,12 @@ from services.auth.app.utils import (
     hash_password,
     verify_password,
     create_access_token,
+    decode_access_token,
+    hash_rounds,
+    needs_rehash,
 )
+from services.auth.app.calibrate import calibrate
+from services.auth.app.config import settings
 
 
 def test_password_hashing():
@@ -20,4 +25,19 @@ def test_password_hashing():
 
 def test_access_token():
     token = create_access_token('user')
-    assert token
+    claims = decode_access_token(token)
+    assert claims['sub'] == 'user'
+    assert claims['jti'] != decode_access_token(create_access_token('user'))['jti']
+
+
+def test_rehash_needed_for_other_cost():
+    hashed = hash_password('secret', rounds=4)
+    assert hash_rounds(hashed) == 4
+    assert verify_password('secret', hashed)
+    assert needs_rehash(hashed) == (settings.bcrypt_rounds != 4)
+
+
+def test_calibrate_recommends_rounds_within_budget():
+    best, timings = calibrate(target_ms=0.0001, samples=1)
+    assert best == 4
+    assert 4 in timings
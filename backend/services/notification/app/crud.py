@@ -1,24 +1,56 @@
+import json
+import uuid
+from functools import lru_cache
 from uuid import UUID
-from sqlalchemy import select, update, delete
+from sqlalchemy import JSON, Integer, and_, bindparam, delete, false, func, insert, literal, select, true, union_all, update
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models, schemas
+from .refcache import ReferenceCache
+from .render import templates
+
+async def _load_notification_types(session: AsyncSession):
+    result = await session.execute(select(models.NotificationType).order_by(models.NotificationType.id))
+    return [schemas.NotificationTypeSchema.model_validate(t, from_attributes=True) for t in result.scalars()]
+
+notification_types = ReferenceCache("notification_types", _load_notification_types)
+
+async def list_notification_types(session: AsyncSession):
+    return await notification_types.get(session)
+
+SETTING_FLAGS = ("enabled", "via_email", "via_telegram")
 
 async def get_notification_settings(session: AsyncSession, user_id: UUID):
+    """Settings for every notification type, with the column defaults where the user has no row."""
+    setting = models.UserNotificationSetting.__table__
     result = await session.execute(
-        select(models.UserNotificationSetting)
-        .where(models.UserNotificationSetting.user_id == user_id)
+        select(
+            models.NotificationType.id.label("notification_type_id"),
+            *(func.coalesce(setting.c[name], setting.c[name].default.arg).label(name) for name in SETTING_FLAGS),
+        )
+        .outerjoin(setting, and_(setting.c.user_id == user_id, setting.c.notification_type_id == models.NotificationType.id))
+        .order_by(models.NotificationType.id)
     )
-    return result.scalars().all()
+    return result.all()
 
 async def update_notification_settings(session: AsyncSession, user_id: UUID, settings: list[schemas.UserNotificationSettingSchema]):
-    for s in settings:
-        await session.execute(
-            update(models.UserNotificationSetting)
-            .where(models.UserNotificationSetting.user_id == user_id,
-                   models.UserNotificationSetting.notification_type_id == s.notification_type_id)
-            .values(enabled=s.enabled, via_email=s.via_email, via_telegram=s.via_telegram)
-        )
+    """Save ``settings`` in one INSERT ... ON CONFLICT DO UPDATE, creating rows for types set the first time."""
+    # One row per type: PostgreSQL refuses to update the same row twice in one statement
+    rows = {
+        s.notification_type_id: {"user_id": user_id, "notification_type_id": s.notification_type_id, **s.model_dump(include=set(SETTING_FLAGS))}
+        for s in settings
+    }
+    if not rows:
+        return
+    insert = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(models.UserNotificationSetting).values(list(rows.values()))
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[models.UserNotificationSetting.user_id, models.UserNotificationSetting.notification_type_id],
+        # onupdate does not fire for the conflict branch
+        set_={**{name: stmt.excluded[name] for name in SETTING_FLAGS}, "updated_at": func.now()},
+    ))
     await session.commit()
 
 async def list_templates(session: AsyncSession, notification_type_id: int | None = None, channel: str | None = None):
@@ -56,10 +88,12 @@ async def update_template(session: AsyncSession, template_id: int, data: schemas
         )
     )
     await session.commit()
+    templates.invalidate(template_id)
 
 async def delete_template(session: AsyncSession, template_id: int):
     await session.execute(delete(models.NotificationTemplate).where(models.NotificationTemplate.id == template_id))
     await session.commit()
+    templates.invalidate(template_id)
 
 async def enqueue_notification(session: AsyncSession, item: schemas.QueueItemCreate):
     obj = models.NotificationQueue(
@@ -74,6 +108,90 @@ async def enqueue_notification(session: AsyncSession, item: schemas.QueueItemCre
     await session.refresh(obj)
     return obj
 
+ENQUEUE_BATCH_SIZE = 10_000
+
+def _recipients(dialect: str):
+    """``recipients(user_id, email_id, telegram_id)`` built from one batch-sized parameter.
+
+    PostgreSQL unnests three uuid arrays; SQLite reads a JSON array of rows.
+    Either way the statement does not grow with the batch, so it is compiled
+    once and stays under driver parameter limits.
+    """
+    if dialect == "postgresql":
+        uuid_array = ARRAY(PG_UUID(as_uuid=True))
+        return func.unnest(
+            bindparam("user_ids", type_=uuid_array),
+            bindparam("email_ids", type_=uuid_array),
+            bindparam("telegram_ids", type_=uuid_array),
+        ).table_valued("user_id", "email_id", "telegram_id").render_derived(name="recipients")
+    rows = func.json_each(bindparam("recipients")).table_valued("value")
+    return select(
+        func.json_extract(rows.c.value, "$[0]").label("user_id"),
+        func.json_extract(rows.c.value, "$[1]").label("email_id"),
+        func.json_extract(rows.c.value, "$[2]").label("telegram_id"),
+    ).subquery("recipients")
+
+def _recipient_params(dialect: str, recipients: list[tuple[UUID, UUID, UUID]]) -> dict:
+    if dialect == "postgresql":
+        user_ids, email_ids, telegram_ids = zip(*recipients)
+        return {"user_ids": list(user_ids), "email_ids": list(email_ids), "telegram_ids": list(telegram_ids)}
+    # Stored the way the UUID type stores them on SQLite: 32 hex digits
+    return {"recipients": json.dumps([[value.hex for value in row] for row in recipients])}
+
+@lru_cache(maxsize=None)
+def _fan_out(dialect: str):
+    """INSERT ... SELECT queueing a row per recipient and enabled channel.
+
+    Users without a settings row for the type get the column defaults: enabled,
+    by email and not by Telegram.
+    """
+    queue = models.NotificationQueue.__table__
+    setting = models.UserNotificationSetting
+    # Queue ids for both channels travel with each user, so no database-side UUID function is needed
+    batch = _recipients(dialect)
+    notification_type_id = bindparam("notification_type_id", type_=Integer)
+    joined = batch.outerjoin(
+        setting, and_(setting.user_id == batch.c.user_id, setting.notification_type_id == notification_type_id)
+    )
+
+    def channel(queue_id, name: str, enabled_by_setting, default):
+        return (
+            select(
+                queue_id,
+                notification_type_id,
+                batch.c.user_id,
+                literal(name),
+                bindparam("payload", type_=JSON),
+                literal("pending"),
+                literal(0),
+                bindparam("scheduled_at", type_=queue.c.scheduled_at.type),
+            )
+            .select_from(joined)
+            .where(func.coalesce(setting.enabled, true()), func.coalesce(enabled_by_setting, default))
+        )
+
+    # Core insert: an ORM insert would read the parameters as row values
+    return insert(queue).from_select(
+        [queue.c.id, queue.c.notification_type_id, queue.c.user_id, queue.c.channel, queue.c.payload, queue.c.status, queue.c.attempts, queue.c.scheduled_at],
+        union_all(
+            channel(batch.c.email_id, "email", setting.via_email, true()),
+            channel(batch.c.telegram_id, "telegram", setting.via_telegram, false()),
+        ),
+    )
+
+async def enqueue_bulk(session: AsyncSession, data: schemas.BulkEnqueueRequest, batch_size: int = ENQUEUE_BATCH_SIZE) -> int:
+    """Queue ``data.payload`` for every user and channel they have enabled; returns rows queued."""
+    dialect = session.get_bind().dialect.name
+    user_ids = list(dict.fromkeys(data.user_ids))
+    shared = {"notification_type_id": data.notification_type_id, "payload": data.payload, "scheduled_at": data.scheduled_at}
+    queued = 0
+    for start in range(0, len(user_ids), batch_size):
+        recipients = [(user_id, uuid.uuid4(), uuid.uuid4()) for user_id in user_ids[start:start + batch_size]]
+        result = await session.execute(_fan_out(dialect), {**shared, **_recipient_params(dialect, recipients)})
+        queued += result.rowcount
+    await session.commit()
+    return queued
+
 async def fetch_queue(session: AsyncSession, status: str = "pending", limit: int = 100):
     result = await session.execute(
         select(models.NotificationQueue).where(models.NotificationQueue.status == status).limit(limit)
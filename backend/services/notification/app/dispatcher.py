@@ -0,0 +1,175 @@
+"""Batch dispatcher for ``notification_queue``.
+
+Each round claims up to ``NOTIFICATION_DISPATCH_BATCH_SIZE`` due rows with one
+``UPDATE ... RETURNING`` that stamps them with this worker's id and a lease
+(``locked_until``). On PostgreSQL the rows are picked with ``FOR UPDATE SKIP
+LOCKED``, so concurrent dispatchers take disjoint batches without waiting on
+each other; SQLite serializes writers, so the lease alone is enough there. The
+batch is delivered concurrently and acknowledged with a single UPDATE. Rows
+whose worker died before acknowledging become claimable again once the lease
+expires. Failed deliveries are retried with exponential backoff until
+``NOTIFICATION_DISPATCH_MAX_ATTEMPTS``, then marked ``failed``. Run with::
+
+    python -m app.dispatcher
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import case, or_, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .models import NotificationQueue
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("NOTIFICATION_DISPATCH_BATCH_SIZE", "100"))
+CONCURRENCY = int(os.getenv("NOTIFICATION_DISPATCH_CONCURRENCY", "20"))
+LEASE_SECONDS = int(os.getenv("NOTIFICATION_DISPATCH_LEASE", "60"))
+POLL_INTERVAL = float(os.getenv("NOTIFICATION_DISPATCH_POLL_INTERVAL", "1"))
+MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_DISPATCH_MAX_ATTEMPTS", "5"))
+RETRY_DELAY = 30
+
+Send = Callable[[Row], Awaitable[None]]
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def deliver(item: Row):
+    """Hand ``item`` to its channel; raising marks the delivery as failed."""
+    if item.channel not in ("email", "telegram"):
+        raise ValueError(f"Unknown channel {item.channel!r}")
+    # SMTP and Telegram clients are not part of the service yet; like the
+    # send_notification task, delivery is recorded without contacting them
+    logger.debug("delivering %s notification %s to %s", item.channel, item.id, item.user_id)
+
+
+def claim_statement(worker: str, batch_size: int, lease: int, now: datetime, skip_locked: bool):
+    due = (
+        select(NotificationQueue.id)
+        .where(
+            NotificationQueue.status == "pending",
+            or_(NotificationQueue.scheduled_at.is_(None), NotificationQueue.scheduled_at <= now),
+            or_(NotificationQueue.locked_until.is_(None), NotificationQueue.locked_until < now),
+        )
+        .order_by(NotificationQueue.created_at)
+        .limit(batch_size)
+    )
+    if skip_locked:
+        due = due.with_for_update(skip_locked=True)
+    return (
+        update(NotificationQueue)
+        .where(NotificationQueue.id.in_(due))
+        .values(claimed_by=worker, locked_until=now + timedelta(seconds=lease), attempts=NotificationQueue.attempts + 1)
+        .returning(
+            NotificationQueue.id,
+            NotificationQueue.notification_type_id,
+            NotificationQueue.user_id,
+            NotificationQueue.channel,
+            NotificationQueue.payload,
+            NotificationQueue.attempts,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def claim_batch(
+    session: AsyncSession, worker: str, batch_size: int = BATCH_SIZE, lease: int = LEASE_SECONDS, now: datetime | None = None
+) -> list[Row]:
+    """Lease up to ``batch_size`` due rows to ``worker`` and return them."""
+    skip_locked = session.get_bind().dialect.name == "postgresql"
+    result = await session.execute(claim_statement(worker, batch_size, lease, now or datetime.now(timezone.utc), skip_locked))
+    items = result.all()
+    await session.commit()
+    return items
+
+
+async def acknowledge(
+    session: AsyncSession, worker: str, items: list[Row], errors: dict[uuid.UUID, str], now: datetime | None = None
+) -> int:
+    """Record the outcome of a claimed batch in one statement; returns rows updated.
+
+    Rows whose lease was taken over by another worker are left alone.
+    """
+    now = now or datetime.now(timezone.utc)
+    final = {item.id for item in items if item.id in errors and item.attempts >= MAX_ATTEMPTS}
+    retry_at = {
+        item.id: now + timedelta(seconds=RETRY_DELAY * 2 ** (item.attempts - 1))
+        for item in items
+        if item.id in errors and item.id not in final
+    }
+    values = {"claimed_by": None, "locked_until": None, "status": "sent"}
+    if errors:
+        values["status"] = case({id_: "failed" if id_ in final else "pending" for id_ in errors}, value=NotificationQueue.id, else_="sent")
+        values["last_error"] = case(errors, value=NotificationQueue.id, else_=NotificationQueue.last_error)
+    if retry_at:
+        values["scheduled_at"] = case(retry_at, value=NotificationQueue.id, else_=NotificationQueue.scheduled_at)
+    result = await session.execute(
+        update(NotificationQueue)
+        .where(NotificationQueue.id.in_([item.id for item in items]), NotificationQueue.claimed_by == worker)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount
+
+
+async def dispatch_once(
+    worker: str, send: Send = deliver, batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY
+) -> int:
+    """Claim, deliver and acknowledge one batch; returns the number of rows claimed."""
+    async with AsyncSessionLocal() as session:
+        items = await claim_batch(session, worker, batch_size)
+        if not items:
+            return 0
+        semaphore = asyncio.Semaphore(concurrency)
+        errors = {}
+
+        async def send_one(item: Row):
+            async with semaphore:
+                try:
+                    await send(item)
+                except Exception as exc:
+                    errors[item.id] = str(exc) or type(exc).__name__
+
+        await asyncio.gather(*(send_one(item) for item in items))
+        await acknowledge(session, worker, items, errors)
+        if errors:
+            logger.warning("%d of %d notifications failed", len(errors), len(items))
+        return len(items)
+
+
+async def run(send: Send = deliver, batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY):
+    worker = worker_id()
+    logger.info("dispatcher %s started", worker)
+    while True:
+        try:
+            claimed = await dispatch_once(worker, send, batch_size, concurrency)
+        except Exception:
+            logger.exception("notification dispatch failed")
+            claimed = 0
+        # A full batch suggests more is due; otherwise wait for new rows
+        if claimed < batch_size:
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver queued notifications in batches")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(batch_size=args.batch_size, concurrency=args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,10 @@ async def startup_event():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+@app.get("/api/notifications/types", response_model=List[schemas.NotificationTypeSchema])
+async def list_types(session=Depends(get_session)):
+    return await crud.list_notification_types(session)
+
 @app.get("/api/notifications/settings", response_model=List[schemas.UserNotificationSettingSchema])
 async def get_settings(user_id: UUID, session=Depends(get_session)):
     return await crud.get_notification_settings(session, user_id)
@@ -62,6 +66,12 @@ async def delete_template(template_id: int, session=Depends(get_session)):
 async def enqueue(data: schemas.QueueItemCreate, session=Depends(get_session)):
     return await crud.enqueue_notification(session, data)
 
+@app.post("/internal/notifications/enqueue/bulk", response_model=schemas.BulkEnqueueResult)
+async def enqueue_bulk(data: schemas.BulkEnqueueRequest, session=Depends(get_session)):
+    """Queue one notification per user and enabled channel, skipping users who opted out."""
+    queued = await crud.enqueue_bulk(session, data)
+    return {"recipients": len(set(data.user_ids)), "queued": queued}
+
 @app.get("/internal/notifications/queue", response_model=List[schemas.QueueItemSchema])
 async def list_queue(status: str = "pending", limit: int = 100, session=Depends(get_session)):
     return await crud.fetch_queue(session, status, limit)
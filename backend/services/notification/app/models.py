@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, Text, JSON, TIMESTAMP
+from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, Text, JSON, TIMESTAMP, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -50,7 +50,28 @@ class NotificationQueue(Base):
     attempts = Column(Integer, default=0)
     last_error = Column(Text)
     scheduled_at = Column(TIMESTAMP(timezone=True))
+    # Lease held by the dispatcher that claimed the row, see ``dispatcher``
+    claimed_by = Column(String(64))
+    locked_until = Column(TIMESTAMP(timezone=True))
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
 
     notification_type = relationship("NotificationType")
+
+    __table_args__ = (
+        # Only pending rows are ever scanned for claiming, so sent ones stay out of the index
+        Index(
+            "ix_notification_queue_pending",
+            "created_at",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
+
+
+class ReferenceVersion(Base):
+    """Version counter per cached reference table, see ``refcache``."""
+    __tablename__ = "reference_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
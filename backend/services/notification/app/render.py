@@ -0,0 +1,90 @@
+"""Compiled template cache for rendering notifications.
+
+Template subjects and bodies are Jinja templates. Compiling one costs far more
+than rendering it, so each template is compiled once per version and kept
+under ``(template id, updated_at)``: a row edited by another worker has a new
+``updated_at`` and misses the cache, while ``crud.update_template`` and
+``crud.delete_template`` drop the entries of their worker at once (SQLite
+timestamps only have one-second resolution). Templates are edited by admins
+and rendered against user-supplied payloads, so they run in Jinja's sandbox,
+and a variable missing from the payload raises instead of rendering empty.
+The cache holds at most ``NOTIFICATION_TEMPLATE_CACHE_SIZE`` compiled versions.
+"""
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+
+from jinja2 import StrictUndefined, Template
+from jinja2.sandbox import SandboxedEnvironment
+
+from .models import NotificationTemplate
+
+TEMPLATE_CACHE_SIZE = int(os.getenv("NOTIFICATION_TEMPLATE_CACHE_SIZE", "1024"))
+
+
+@dataclass(frozen=True)
+class RenderedMessage:
+    subject: str | None
+    body: str
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    subject: Template | None
+    body: Template
+
+    def render(self, payload: dict) -> RenderedMessage:
+        subject = self.subject.render(payload) if self.subject is not None else None
+        return RenderedMessage(subject, self.body.render(payload))
+
+
+class TemplateRenderer:
+    def __init__(self, max_size: int = TEMPLATE_CACHE_SIZE):
+        self.max_size = max_size
+        # Email and Telegram bodies are plain text; escaping is left to the channel
+        self.environment = SandboxedEnvironment(undefined=StrictUndefined, autoescape=False, keep_trailing_newline=True)
+        # The Celery worker renders on its own loop thread, hence the lock
+        self._lock = threading.Lock()
+        self._compiled: OrderedDict[tuple[int, datetime | None], CompiledTemplate] = OrderedDict()
+
+    def compile(self, template: NotificationTemplate) -> CompiledTemplate:
+        """Return the compiled form of ``template``, compiling it on first use."""
+        key = (template.id, template.updated_at)
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                return compiled
+        compiled = CompiledTemplate(
+            self.environment.from_string(template.subject) if template.subject is not None else None,
+            self.environment.from_string(template.body or ""),
+        )
+        with self._lock:
+            self._compiled[key] = compiled
+            while len(self._compiled) > self.max_size:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def render(self, template: NotificationTemplate, payload: dict) -> RenderedMessage:
+        return self.compile(template).render(payload)
+
+    def render_batch(self, template: NotificationTemplate, payloads: Iterable[dict]) -> list[RenderedMessage]:
+        """Render every payload against one compiled ``template``."""
+        compiled = self.compile(template)
+        return [compiled.render(payload) for payload in payloads]
+
+    def invalidate(self, template_id: int):
+        """Drop every compiled version of ``template_id``; call after the commit that changed it."""
+        with self._lock:
+            for key in [key for key in self._compiled if key[0] == template_id]:
+                del self._compiled[key]
+
+    def clear(self):
+        with self._lock:
+            self._compiled.clear()
+
+
+templates = TemplateRenderer()
@@ -1,7 +1,10 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
 from typing import Optional
 from uuid import UUID
 
+MAX_BULK_RECIPIENTS = 100_000
+
 class NotificationTypeSchema(BaseModel):
     id: int
     code: str
@@ -44,3 +47,13 @@ class QueueItemSchema(QueueItemCreate):
 
     class Config:
         orm_mode = True
+
+class BulkEnqueueRequest(BaseModel):
+    notification_type_id: int
+    user_ids: list[UUID] = Field(max_length=MAX_BULK_RECIPIENTS)
+    payload: dict
+    scheduled_at: Optional[datetime] = None
+
+class BulkEnqueueResult(BaseModel):
+    recipients: int
+    queued: int
@@ -0,0 +1,112 @@
+"""Measure notification rendering throughput with and without the compiled template cache.
+
+Renders ``--messages`` payloads against ``--templates`` templates (an email
+subject and a body with a loop and filters), picking the template for each
+message at random. Three ways:
+
+- compiling the template for every message, as rendering without a cache would;
+- ``templates.render`` per message through the cache;
+- ``templates.render_batch`` with the messages grouped by template.
+
+Run from ``backend/``::
+
+    python services/notification/benchmarks/bench_render.py --messages 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+os.environ["NOTIFICATION_DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'render.db')}"
+
+from services.notification.app import models
+from services.notification.app.render import TemplateRenderer
+
+SUBJECT = "{{ course.title }}: {{ event | replace('_', ' ') | capitalize }} for {{ user.first_name }}"
+BODY = """Hello {{ user.first_name }} {{ user.last_name }},
+
+{% if event == "deadline" -%}
+The deadline for {{ assignment }} in {{ course.title }} is {{ due }}.
+{%- else -%}
+There is news in {{ course.title }}:
+{%- endif %}
+{% for lesson in lessons %}
+  {{ loop.index }}. {{ lesson.title | title }} ({{ lesson.minutes }} min){% if lesson.new %} - new{% endif %}
+{%- endfor %}
+
+You have completed {{ "%.0f" | format(progress * 100) }}% of the course.
+{{ course.url }}
+"""
+
+
+def make_templates(count: int) -> list[models.NotificationTemplate]:
+    now = datetime.now(timezone.utc)
+    return [
+        models.NotificationTemplate(id=i, notification_type_id=1, channel="email", subject=SUBJECT, body=BODY + "#" * i, updated_at=now)
+        for i in range(count)
+    ]
+
+
+def make_payload(rng: random.Random, n: int) -> dict:
+    return {
+        "user": {"first_name": f"User{n}", "last_name": "Example"},
+        "event": rng.choice(["deadline", "new_lessons"]),
+        "assignment": "Homework 3",
+        "due": "2026-11-01",
+        "course": {"title": f"Course {n % 50}", "url": f"https://example.org/courses/{n % 50}"},
+        "lessons": [{"title": f"lesson {j}", "minutes": 10 + j, "new": j % 2 == 0} for j in range(rng.randint(1, 5))],
+        "progress": rng.random(),
+    }
+
+
+def measure(label: str, messages: int, run):
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {messages:>7} messages {elapsed:>7.2f}s {messages / elapsed:>9.0f} messages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--templates", type=int, default=20)
+    parser.add_argument("--baseline", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    templates = make_templates(args.templates)
+    messages = [(rng.choice(templates), make_payload(rng, n)) for n in range(args.messages)]
+    by_template = defaultdict(list)
+    for template, payload in messages:
+        by_template[template.id].append(payload)
+    renderer = TemplateRenderer()
+
+    def compile_per_message():
+        for template, payload in messages[:args.baseline]:
+            renderer.environment.from_string(template.subject).render(payload)
+            renderer.environment.from_string(template.body).render(payload)
+
+    def cached():
+        for template, payload in messages:
+            renderer.render(template, payload)
+
+    def batched():
+        for template in templates:
+            renderer.render_batch(template, by_template[template.id])
+
+    measure("compile per message", args.baseline, compile_per_message)
+    measure("cached, per message", args.messages, cached)
+    measure("cached, batched", args.messages, batched)
+
+
+if __name__ == "__main__":
+    main()
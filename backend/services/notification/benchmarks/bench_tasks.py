@@ -0,0 +1,97 @@
+"""Measure per-task overhead of the notification Celery task.
+
+Runs ``send_notification`` ``--tasks`` times in process (no broker) three ways:
+
+- ``asyncio.run`` per task, as the task used to. Pooled connections outlive
+  their loop here; aiosqlite tolerates that, asyncpg does not.
+- ``asyncio.run`` per task with the pool disposed after each one, which is
+  what a correct per-task loop on asyncpg requires.
+- the worker-lifetime loop the task now uses.
+
+Prints the mean time per task and the number of connections opened.
+
+Run from ``backend/``::
+
+    python services/notification/benchmarks/bench_tasks.py --tasks 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, insert
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "tasks.db")
+os.environ["NOTIFICATION_DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from services.notification.app import models, tasks
+from services.notification.app.database import Base, engine
+
+
+def seed(items: int) -> list[str]:
+    ids = [uuid.uuid4() for _ in range(items)]
+    sync_engine = create_engine(f"sqlite:///{DB_PATH}")
+    Base.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(insert(models.NotificationType), [{"id": 1, "code": "bench"}])
+        conn.execute(insert(models.NotificationQueue), [
+            {"id": queue_id, "notification_type_id": 1, "user_id": uuid.uuid4(), "channel": "email", "payload": {}}
+            for queue_id in ids
+        ])
+    sync_engine.dispose()
+    # SQLite gives the UUID column numeric affinity; skip ids it would store as numbers
+    return [str(queue_id) for queue_id in ids if any(c in "abcdf" for c in queue_id.hex)]
+
+
+def per_task_loop(queue_id: str):
+    asyncio.run(tasks._send(uuid.UUID(queue_id)))
+
+
+def per_task_loop_disposed(queue_id: str):
+    async def send():
+        try:
+            await tasks._send(uuid.UUID(queue_id))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(send())
+
+
+def measure(label: str, run, ids: list[str]):
+    connects = []
+
+    def on_connect(*args):
+        connects.append(1)
+
+    event.listen(engine.sync_engine, "connect", on_connect)
+    start = time.perf_counter()
+    for queue_id in ids:
+        run(queue_id)
+    elapsed = time.perf_counter() - start
+    event.remove(engine.sync_engine, "connect", on_connect)
+    print(f"{label:<28} {elapsed / len(ids) * 1e6:>8.0f} us/task  {len(connects):>5} connections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=2000)
+    args = parser.parse_args()
+
+    ids = seed(args.tasks * 3)
+    per_run = len(ids) // 3
+    measure("asyncio.run per task", per_task_loop, ids[:per_run])
+    asyncio.run(engine.dispose())
+    measure("asyncio.run + dispose", per_task_loop_disposed, ids[per_run:2 * per_run])
+    measure("worker loop", tasks.send_notification, ids[2 * per_run:])
+    tasks.worker_loop.stop()
+
+
+if __name__ == "__main__":
+    main()
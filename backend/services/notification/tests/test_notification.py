@@ -2,8 +2,11 @@ import os
 import sys
 import uuid
 import asyncio
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import delete, event, select
 
 # Add repository root to the path so ``services`` can be imported as a package
 ROOT = Path(__file__).resolve().parents[3]
@@ -16,7 +19,7 @@ os.environ.setdefault("NOTIFICATION_DATABASE_URL", f"sqlite+aiosqlite:///{DB_PAT
 
 from services.notification.app.main import app
 from services.notification.app.database import engine, Base, AsyncSessionLocal
-from services.notification.app import models
+from services.notification.app import crud, dispatcher, models, tasks
 
 async def _init_db():
     async with engine.begin() as conn:
@@ -43,3 +46,246 @@ def test_enqueue_and_list():
     resp = client.post("/internal/notifications/enqueue", json=data)
     assert resp.status_code == 200
     assert resp.json()["status"] == "pending"
+
+def test_notification_types_cached_until_version_bump():
+    assert [t["code"] for t in client.get("/api/notifications/types").json()] == ["test"]
+
+    async def add_type():
+        async with AsyncSessionLocal() as session:
+            session.add(models.NotificationType(id=2, code="digest"))
+            await crud.notification_types.bump(session)
+            await session.commit()
+
+    asyncio.get_event_loop().run_until_complete(add_type())
+    # still served from memory until the next version check
+    assert [t["code"] for t in client.get("/api/notifications/types").json()] == ["test"]
+    crud.notification_types._checked_at = 0
+    assert [t["code"] for t in client.get("/api/notifications/types").json()] == ["test", "digest"]
+
+def test_dispatcher_leases_disjoint_batches_and_acks_once():
+    sent, statements = [], []
+
+    async def send(item):
+        if item.channel == "sms":
+            raise ValueError("no sms gateway")
+        sent.append(item.id)
+
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement.split()[0].upper())
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(models.NotificationQueue))
+            session.add_all(
+                models.NotificationQueue(notification_type_id=1, user_id=uuid.uuid4(), channel="sms" if i == 3 else "email", payload={"n": i})
+                for i in range(5)
+            )
+            await session.commit()
+
+            first = await dispatcher.claim_batch(session, "a", batch_size=3)
+            second = await dispatcher.claim_batch(session, "b", batch_size=3)
+            assert len(first) == 3 and len(second) == 2
+            assert not {item.id for item in first} & {item.id for item in second}
+            assert await dispatcher.claim_batch(session, "c") == []
+
+            # Leases that run out are claimed again, and the old holder's ack is ignored
+            expired = datetime.now(timezone.utc) + timedelta(seconds=dispatcher.LEASE_SECONDS + 1)
+            assert len(await dispatcher.claim_batch(session, "c", now=expired)) == 5
+            assert await dispatcher.acknowledge(session, "a", first, {}) == 0
+            await session.execute(models.NotificationQueue.__table__.update().values(claimed_by=None, locked_until=None, attempts=0))
+            await session.commit()
+
+        event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+        try:
+            claimed = await dispatcher.dispatch_once("w", send=send)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+        async with AsyncSessionLocal() as session:
+            rows = (await session.scalars(select(models.NotificationQueue))).all()
+        return claimed, rows
+
+    claimed, rows = asyncio.get_event_loop().run_until_complete(scenario())
+    assert claimed == 5
+    # one claiming UPDATE ... RETURNING, one acknowledging UPDATE
+    assert statements == ["UPDATE", "UPDATE"]
+    assert sorted(sent) == sorted(row.id for row in rows if row.channel == "email")
+    assert {row.status for row in rows if row.channel == "email"} == {"sent"}
+    failed = next(row for row in rows if row.channel == "sms")
+    assert (failed.status, failed.attempts, failed.last_error, failed.claimed_by) == ("pending", 1, "no sms gateway", None)
+    assert failed.scheduled_at > datetime.utcnow()
+
+
+def test_dispatcher_skips_locked_rows_on_postgres():
+    from sqlalchemy.dialects import postgresql
+
+    statement = dispatcher.claim_statement("w", 100, 60, datetime.now(timezone.utc), skip_locked=True)
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert "FOR UPDATE SKIP LOCKED) RETURNING" in sql
+
+
+def test_tasks_reuse_worker_loop_and_pooled_connections():
+    async def enqueue():
+        async with AsyncSessionLocal() as session:
+            items = [models.NotificationQueue(notification_type_id=1, user_id=uuid.uuid4(), channel="email", payload={}) for _ in range(2)]
+            session.add_all(items)
+            await session.commit()
+            return [str(item.id) for item in items]
+
+    first, second = asyncio.get_event_loop().run_until_complete(enqueue())
+    connects = []
+
+    def on_connect(*args):
+        connects.append(1)
+
+    event.listen(engine.sync_engine, "connect", on_connect)
+    try:
+        tasks.send_notification(first)
+        loop, opened = tasks.worker_loop._loop, len(connects)
+        tasks.send_notification(second)
+        assert tasks.worker_loop._loop is loop
+        assert len(connects) == opened
+    finally:
+        event.remove(engine.sync_engine, "connect", on_connect)
+        tasks.worker_loop.stop()
+    assert tasks.worker_loop._loop is None
+
+    async def statuses():
+        async with AsyncSessionLocal() as session:
+            rows = await session.scalars(select(models.NotificationQueue.status).where(models.NotificationQueue.id.in_([uuid.UUID(first), uuid.UUID(second)])))
+            return rows.all()
+
+    assert asyncio.get_event_loop().run_until_complete(statuses()) == ["sent", "sent"]
+
+
+def test_bulk_enqueue_fans_out_by_settings_in_one_insert():
+    defaults, both, opted_out, telegram_only, other_type = (uuid.uuid4() for _ in range(5))
+
+    async def seed():
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(models.NotificationQueue))
+            session.add_all([
+                models.UserNotificationSetting(user_id=both, notification_type_id=1, via_email=True, via_telegram=True),
+                models.UserNotificationSetting(user_id=opted_out, notification_type_id=1, enabled=False),
+                models.UserNotificationSetting(user_id=telegram_only, notification_type_id=1, via_email=False, via_telegram=True),
+                models.UserNotificationSetting(user_id=other_type, notification_type_id=2, enabled=False),
+            ])
+            await session.commit()
+
+    asyncio.get_event_loop().run_until_complete(seed())
+    statements = []
+
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement.split()[0].upper())
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.post("/internal/notifications/enqueue/bulk", json={
+            "notification_type_id": 1,
+            "user_ids": [str(u) for u in (defaults, both, opted_out, telegram_only, other_type, defaults)],
+            "payload": {"course": "Intro"},
+        })
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+    assert response.status_code == 200
+    assert response.json() == {"recipients": 5, "queued": 5}
+    assert statements.count("INSERT") == 1
+
+    async def queued():
+        async with AsyncSessionLocal() as session:
+            return (await session.scalars(select(models.NotificationQueue))).all()
+
+    rows = asyncio.get_event_loop().run_until_complete(queued())
+    assert sorted((row.user_id, row.channel) for row in rows) == sorted([
+        (defaults, "email"), (both, "email"), (both, "telegram"), (telegram_only, "telegram"), (other_type, "email"),
+    ])
+    assert all(row.payload == {"course": "Intro"} and row.status == "pending" and row.attempts == 0 for row in rows)
+    assert len({row.id for row in rows}) == 5
+
+
+def test_template_cache_compiles_once_and_invalidates_on_update():
+    from jinja2.exceptions import SecurityError, UndefinedError
+    from sqlalchemy.orm import load_only
+    from services.notification.app.render import templates
+
+    async def seed():
+        async with AsyncSessionLocal() as session:
+            template = models.NotificationTemplate(
+                notification_type_id=1, channel="email", subject="Hi {{ name }}", body="{{ course }} starts {{ date }}"
+            )
+            session.add(template)
+            await session.commit()
+            return template.id
+
+    template_id = asyncio.get_event_loop().run_until_complete(seed())
+
+    async def load():
+        # The admin endpoints store an all-digit placeholder in updated_by, which SQLite keeps as a number
+        columns = load_only(models.NotificationTemplate.subject, models.NotificationTemplate.body, models.NotificationTemplate.updated_at)
+        async with AsyncSessionLocal() as session:
+            return await session.get(models.NotificationTemplate, template_id, options=[columns])
+
+    template = asyncio.get_event_loop().run_until_complete(load())
+    compiled = templates.compile(template)
+    assert templates.compile(template) is compiled
+    rendered = templates.render_batch(template, [
+        {"name": "Ann", "course": "Intro", "date": "Monday"},
+        {"name": "Bob", "course": "SQL", "date": "Friday"},
+    ])
+    assert [(m.subject, m.body) for m in rendered] == [("Hi Ann", "Intro starts Monday"), ("Hi Bob", "SQL starts Friday")]
+
+    client.put(f"/api/notifications/templates/{template_id}", json={
+        "notification_type_id": 1, "channel": "email", "subject": None, "body": "{{ course }} moved",
+    })
+    # Same second on SQLite, so only the explicit invalidation retires the old version
+    template = asyncio.get_event_loop().run_until_complete(load())
+    assert templates.render(template, {"course": "Intro"}).body == "Intro moved"
+
+    # Missing variables must not render empty
+    with pytest.raises(UndefinedError):
+        templates.render(template, {})
+    template.body = "{{ course.__class__.__mro__ }}"
+    templates.invalidate(template.id)
+    with pytest.raises(SecurityError):
+        templates.render(template, {"course": "Intro"})
+    client.delete(f"/api/notifications/templates/{template_id}")
+
+
+def test_settings_upsert_in_one_statement_and_defaults_for_missing_types():
+    user_id = uuid.uuid4()
+
+    async def add_type():
+        async with AsyncSessionLocal() as session:
+            if not await session.get(models.NotificationType, 2):
+                session.add(models.NotificationType(id=2, code="second"))
+                await session.commit()
+
+    asyncio.get_event_loop().run_until_complete(add_type())
+    defaults = {"enabled": True, "via_email": True, "via_telegram": False}
+    resp = client.get("/api/notifications/settings", params={"user_id": str(user_id)})
+    assert resp.json() == [{"notification_type_id": 1, **defaults}, {"notification_type_id": 2, **defaults}]
+
+    statements = []
+
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement.split()[0].upper())
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        # Both rows are new: the old loop of UPDATEs saved nothing here
+        client.put("/api/notifications/settings", params={"user_id": str(user_id)}, json=[
+            {"notification_type_id": 1, "via_telegram": True},
+            {"notification_type_id": 2, "enabled": False},
+        ])
+        client.put("/api/notifications/settings", params={"user_id": str(user_id)}, json=[
+            {"notification_type_id": 1, "via_email": False, "via_telegram": True},
+        ])
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+    assert statements.count("INSERT") == 2 and "UPDATE" not in statements
+
+    resp = client.get("/api/notifications/settings", params={"user_id": str(user_id)})
+    assert resp.json() == [
+        {"notification_type_id": 1, "enabled": True, "via_email": False, "via_telegram": True},
+        {"notification_type_id": 2, "enabled": False, "via_email": True, "via_telegram": False},
+    ]
+
@@ -0,0 +1,99 @@
+"""Compressed archive of profile history moved out of the database.
+
+Archived months live in a separate SQLite file, ``PROFILE_HISTORY_ARCHIVE``,
+as one zlib-compressed JSON rollup per user and month, newest entry first.
+It has to sit on storage every replica reads, so there is no default: while it
+is unset nothing is archived and history stays in the database.
+Reading a user's archived history is a primary key range scan plus
+decompressing only the months a page needs. ``retention`` writes it; the
+methods here block, so async code calls them through a thread.
+"""
+import json
+import os
+import sqlite3
+import zlib
+from datetime import datetime, timezone
+from typing import Iterable
+
+ARCHIVE_PATH = os.getenv("PROFILE_HISTORY_ARCHIVE", "")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS rollups ("
+    " user_id TEXT NOT NULL, month TEXT NOT NULL, entries INTEGER NOT NULL, payload BLOB NOT NULL,"
+    " PRIMARY KEY (user_id, month)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS months ("
+    " month TEXT PRIMARY KEY, users INTEGER NOT NULL, entries INTEGER NOT NULL, archived_at TEXT NOT NULL)",
+)
+
+
+def utc(value: datetime) -> datetime:
+    """Aware UTC; SQLite hands back naive datetimes that are already UTC."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+class HistoryArchive:
+    def __init__(self, path: str = ARCHIVE_PATH):
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        for statement in SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    def write(self, month: str, rollups: Iterable[tuple[str, list[dict]]]):
+        """Store complete rollups for ``month``; rewriting a user's rollup replaces it."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO rollups (user_id, month, entries, payload) VALUES (?, ?, ?, ?)",
+                ((user_id, month, len(entries), zlib.compress(json.dumps(entries).encode())) for user_id, entries in rollups),
+            )
+        conn.close()
+
+    def finish(self, month: str):
+        """Record ``month`` as archived once all of its rollups are written."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO months (month, users, entries, archived_at)"
+                " SELECT ?, count(*), coalesce(sum(entries), 0), ? FROM rollups WHERE month = ?",
+                (month, datetime.now(timezone.utc).isoformat(), month),
+            )
+        conn.close()
+
+    def months(self) -> dict[str, tuple[int, int]]:
+        """``{month: (users, entries)}`` for every archived month."""
+        conn = self._connect()
+        try:
+            return {month: (users, entries) for month, users, entries in conn.execute("SELECT month, users, entries FROM months")}
+        finally:
+            conn.close()
+
+    def read(self, user_id: str, limit: int, skip: int = 0, after: tuple[datetime, int] | None = None) -> list[dict]:
+        """Entries newest first, continuing strictly before ``after`` when given."""
+        if not self.path or not os.path.exists(self.path):
+            return []
+        query, params = "SELECT payload FROM rollups WHERE user_id = ?", [user_id]
+        if after is not None:
+            after = (utc(after[0]), after[1])
+            query += " AND month <= ?"
+            params.append(f"{after[0]:%Y-%m}")
+        conn = self._connect()
+        try:
+            entries = []
+            for (payload,) in conn.execute(query + " ORDER BY month DESC", params):
+                for entry in json.loads(zlib.decompress(payload)):
+                    entry["changed_at"] = datetime.fromisoformat(entry["changed_at"])
+                    if after is not None and (entry["changed_at"], entry["id"]) >= after:
+                        continue
+                    if skip:
+                        skip -= 1
+                        continue
+                    entries.append(entry)
+                    if len(entries) == limit:
+                        return entries
+            return entries
+        finally:
+            conn.close()
+
+
+history_archive = HistoryArchive()
@@ -0,0 +1,172 @@
+"""Content-addressed avatar storage.
+
+Uploads are parsed from the request stream as it arrives: the file part is
+hashed and written to a temporary file chunk by chunk, so memory stays bounded
+and an oversized upload is rejected as soon as it crosses the limit, without
+reading the rest of the body. The image type is taken from the file's magic
+bytes, and the file is stored as ``<sha256>.<ext>`` so identical avatars share
+one file.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator
+
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+AVATAR_DIR = os.getenv("PROFILE_AVATAR_DIR", "avatars")
+MAX_AVATAR_SIZE = 5 * 1024 * 1024
+# Room for the boundaries and part headers around the file in a multipart body
+MULTIPART_OVERHEAD = 16 * 1024
+
+MAGIC_BYTES = {
+    b"\xff\xd8\xff": "jpg",
+    b"\x89PNG\r\n\x1a\n": "png",
+}
+MAGIC_SIZE = max(map(len, MAGIC_BYTES))
+
+
+class AvatarError(ValueError):
+    pass
+
+
+class AvatarTooLarge(AvatarError):
+    pass
+
+
+class InvalidImage(AvatarError):
+    pass
+
+
+def detect_extension(head: bytes) -> str:
+    for magic, ext in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return ext
+    raise InvalidImage("Invalid image type")
+
+
+def find(digest: str) -> str | None:
+    """Path of the stored original with this digest, if any."""
+    for ext in MAGIC_BYTES.values():
+        path = os.path.join(AVATAR_DIR, f"{digest}.{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class AvatarWriter:
+    """Hashes and writes an avatar chunk by chunk; ``finish`` moves it into place.
+
+    Blocking; call ``write`` and ``finish`` from a worker thread.
+    """
+
+    def __init__(self, max_size: int):
+        os.makedirs(AVATAR_DIR, exist_ok=True)
+        self.max_size = max_size
+        self.size = 0
+        self.ext = None
+        self._head = b""
+        self._digest = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(dir=AVATAR_DIR, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise AvatarTooLarge("File too large")
+        if self.ext is None and len(self._head) < MAGIC_SIZE:
+            self._head += chunk[:MAGIC_SIZE]
+            if len(self._head) >= MAGIC_SIZE:
+                self.ext = detect_extension(self._head)
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def finish(self) -> str:
+        self._file.close()
+        ext = self.ext or detect_extension(self._head)
+        path = os.path.join(AVATAR_DIR, f"{self._digest.hexdigest()}.{ext}")
+        if os.path.exists(path):
+            os.remove(self._tmp_path)
+        else:
+            os.replace(self._tmp_path, path)
+        return path
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class _FilePart:
+    """Parser callbacks that pass on the data of one named multipart field."""
+
+    def __init__(self, field: str):
+        self.field = field.encode()
+        self.chunks: list[bytes] = []
+        self.found = False
+        self.complete = False
+        self._headers: dict[bytes, bytes] = {}
+        self._name = self._value = b""
+        self._active = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._headers.clear,
+            "on_header_field": lambda data, start, end: setattr(self, "_name", self._name + data[start:end]),
+            "on_header_value": lambda data, start, end: setattr(self, "_value", self._value + data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _header_end(self):
+        self._headers[self._name.lower()] = self._value
+        self._name = self._value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._active = not self.found and options.get(b"name") == self.field
+        self.found = self.found or self._active
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._active:
+            self.chunks.append(bytes(data[start:end]))
+
+    def _part_end(self):
+        if self._active:
+            self._active = False
+            self.complete = True
+
+
+async def store_multipart(
+    body: AsyncIterator[bytes], content_type: str, field: str = "file", max_size: int | None = None
+) -> str:
+    """Store the ``field`` part of a streamed multipart body and return the stored path.
+
+    Reading stops as soon as the part is complete or has grown past
+    ``max_size`` (``MAX_AVATAR_SIZE`` by default).
+    """
+    kind, options = parse_options_header(content_type)
+    if kind != b"multipart/form-data" or not options.get(b"boundary"):
+        raise AvatarError("Expected a multipart/form-data upload")
+    part = _FilePart(field)
+    parser = MultipartParser(options[b"boundary"], part.callbacks())
+    writer = AvatarWriter(MAX_AVATAR_SIZE if max_size is None else max_size)
+    try:
+        async for chunk in body:
+            parser.write(chunk)
+            if part.chunks:
+                data = b"".join(part.chunks)
+                part.chunks.clear()
+                await asyncio.to_thread(writer.write, data)
+            if part.complete:
+                break
+        if not part.complete:
+            raise AvatarError(f"Missing {field} field" if not part.found else "Incomplete upload")
+        return await asyncio.to_thread(writer.finish)
+    except BaseException:
+        writer.abort()
+        raise
@@ -0,0 +1,169 @@
+"""Bulk export and import of profiles as NDJSON or CSV.
+
+Export streams ``profiles`` through a server-side cursor and yields each
+partition of rows as soon as it is read, so memory does not grow with the
+table. Import reads rows from a file-like body and upserts in batches:
+one query loads the batch's existing profiles, then new profiles, changed
+profiles and their ``ProfileHistory`` rows are each written with a single
+statement before the batch commits. A batch that a concurrent write makes
+violate a constraint is rolled back, and its written rows are reported as
+errors.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import AsyncIterator, Iterable, Iterator, TextIO
+from uuid import UUID
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+from .cache import profile_cache
+from .crud import _history_value, experience_levels
+
+BATCH_SIZE = 1000
+EXPORT_FIELDS = ("user_id",) + tuple(schemas.ProfileBase.model_fields) + ("updated_at",)
+PROFILE_FIELDS = tuple(schemas.ProfileBase.model_fields)
+
+
+def _export_value(value):
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+async def export_profiles(db: AsyncSession, fmt: str, batch_size: int = BATCH_SIZE) -> AsyncIterator[str]:
+    columns = [getattr(models.Profile, field) for field in EXPORT_FIELDS]
+    result = await db.stream(select(*columns).order_by(models.Profile.user_id).execution_options(yield_per=batch_size))
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        async for rows in result.partitions():
+            writer.writerows([[_export_value(v) for v in row] for row in rows])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.getvalue():  # header only, the table is empty
+            yield buffer.getvalue()
+        return
+    async for rows in result.partitions():
+        yield "".join(
+            json.dumps({field: _export_value(value) for field, value in zip(EXPORT_FIELDS, row)}) + "\n" for row in rows
+        )
+
+
+def parse_rows(text: TextIO, fmt: str) -> Iterator[dict]:
+    """Rows as dicts; empty CSV cells are null."""
+    if fmt == "csv":
+        for row in csv.DictReader(text):
+            yield {field: value or None for field, value in row.items()}
+        return
+    for line in text:
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else {}
+
+
+def batches(rows: Iterable[dict], size: int) -> Iterator[list[tuple[int, dict]]]:
+    batch = []
+    for i, row in enumerate(rows):
+        batch.append((i, row))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def import_batch(db: AsyncSession, batch: list[tuple[int, dict]]) -> list[dict]:
+    results, valid, level_ids = {}, {}, None
+    for i, row in batch:
+        try:
+            data = schemas.ProfileCreate.model_validate(row)
+            if data.user_id is None:
+                raise ValueError("user_id is required")
+            if data.experience_id is not None:
+                if level_ids is None:
+                    level_ids = {level.id for level in await experience_levels.get(db)}
+                if data.experience_id not in level_ids:
+                    raise ValueError(f"experience level {data.experience_id} does not exist")
+        except (ValidationError, ValueError) as exc:
+            error = exc.errors()[0]["msg"] if isinstance(exc, ValidationError) else str(exc)
+            results[i] = {"row": i, "user_id": row.get("user_id"), "status": "invalid", "error": error}
+            continue
+        # A later row for the same user wins, as it would if applied one by one
+        if data.user_id in valid:
+            earlier = valid[data.user_id][0]
+            results[earlier] = {"row": earlier, "user_id": str(data.user_id), "status": "skipped", "error": f"superseded by row {i}"}
+        valid[data.user_id] = (i, data)
+
+    columns = [models.Profile.user_id] + [getattr(models.Profile, field) for field in PROFILE_FIELDS]
+    existing = {
+        row.user_id: row
+        for row in (await db.execute(select(*columns).where(models.Profile.user_id.in_(list(valid))))).all()
+    } if valid else {}
+
+    now = models.utcnow()
+    new_profiles, changed_profiles, history = [], [], []
+    for user_id, (i, data) in valid.items():
+        current = existing.get(user_id)
+        if current is None:
+            # Every column is present so the batch is one executemany
+            new_profiles.append({"user_id": user_id, **data.model_dump(include=set(PROFILE_FIELDS)), "updated_at": now})
+            results[i] = {"row": i, "user_id": str(user_id), "status": "created"}
+            continue
+        fields = data.model_dump(include=set(PROFILE_FIELDS), exclude_unset=True)
+        changes = {field: value for field, value in fields.items() if getattr(current, field) != value}
+        if not changes:
+            results[i] = {"row": i, "user_id": str(user_id), "status": "unchanged"}
+            continue
+        changed_profiles.append({"user_id": user_id, **changes, "updated_at": now})
+        history.extend(
+            {
+                "user_id": user_id,
+                "field": field,
+                "old_value": _history_value(getattr(current, field)),
+                "new_value": _history_value(value),
+                "changed_at": now,
+                "changed_by": None,
+            }
+            for field, value in changes.items()
+        )
+        results[i] = {"row": i, "user_id": str(user_id), "status": "updated"}
+
+    try:
+        # Core inserts against the tables: ORM bulk inserts split the batch wherever a row has a null column
+        if new_profiles:
+            await db.execute(insert(models.Profile.__table__), new_profiles)
+        if changed_profiles:
+            # ORM bulk UPDATE by primary key: rows with the same changed columns share one executemany
+            await db.execute(update(models.Profile), changed_profiles)
+        if history:
+            await db.execute(insert(models.ProfileHistory.__table__), history)
+        await db.commit()
+    except IntegrityError:
+        # A profile created or an experience level deleted since the lookups above
+        await db.rollback()
+        for i, result in results.items():
+            if result["status"] in ("created", "updated"):
+                results[i] = {**result, "status": "error", "error": "conflicts with a concurrent change"}
+    else:
+        for row in changed_profiles:
+            profile_cache.invalidate(row["user_id"])
+    return [results[i] for i in sorted(results)]
+
+
+async def import_profiles(db: AsyncSession, rows: Iterable[dict], batch_size: int = BATCH_SIZE) -> AsyncIterator[dict]:
+    for batch in batches(rows, batch_size):
+        for result in await import_batch(db, batch):
+            yield result
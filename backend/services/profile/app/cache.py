@@ -0,0 +1,82 @@
+"""Per-worker cache of serialized profiles.
+
+Entries hold the JSON body and ETag of ``GET /api/profile`` so a hit skips
+both the database and serialization. Writes through ``crud`` invalidate the
+entry in this worker; other workers pick up the change once the entry's TTL
+runs out.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from uuid import UUID
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "30"))  # seconds
+
+
+class ProfileCache:
+    """LRU cache with a per-entry TTL, bounded to ``maxsize`` profiles."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[UUID, tuple[float, str, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, user_id: UUID) -> tuple[str, bytes] | None:
+        """Return ``(etag, body)`` for a fresh entry, or None."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, user_id: UUID, etag: str, body: bytes):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._remove(user_id)
+            self._entries[user_id] = (time.monotonic() + self.ttl, etag, body)
+            self._bytes += len(body)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, user_id: UUID):
+        with self._lock:
+            self._remove(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def _remove(self, user_id: UUID):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[2])
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.maxsize,
+            "body_bytes": self._bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
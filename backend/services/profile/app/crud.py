@@ -1,14 +1,35 @@
-from sqlalchemy.orm import Session
+import asyncio
+import base64
+import json
+import re
+from datetime import datetime
+
+from sqlalchemy import column, func, insert, literal_column, select, table, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, selectinload
 from . import models, schemas
+from .archive import history_archive
+from .cache import profile_cache
+from .refcache import ReferenceCache
 from typing import List
 from uuid import UUID, uuid4
 
 
-def get_profile(db: Session, user_id: UUID) -> models.Profile:
-    return db.query(models.Profile).filter(models.Profile.user_id == user_id).first()
+async def get_profile(db: AsyncSession, user_id: UUID) -> models.Profile:
+    return await db.scalar(select(models.Profile).where(models.Profile.user_id == user_id))
+
+
+async def get_profiles(db: AsyncSession, user_ids: List[UUID]) -> dict[UUID, models.Profile]:
+    """Load many profiles with their social accounts in two queries, keyed by user id."""
+    result = await db.scalars(
+        select(models.Profile)
+        .where(models.Profile.user_id.in_(set(user_ids)))
+        .options(selectinload(models.Profile.social_accounts))
+    )
+    return {profile.user_id: profile for profile in result}
 
 
-def create_profile(db: Session, profile_in: schemas.ProfileCreate) -> models.Profile:
+async def create_profile(db: AsyncSession, profile_in: schemas.ProfileCreate) -> models.Profile:
     profile = models.Profile(
         user_id=profile_in.user_id or uuid4(),
         first_name=profile_in.first_name,
@@ -23,80 +44,261 @@ def create_profile(db: Session, profile_in: schemas.ProfileCreate) -> models.Pro
         avatar_url=profile_in.avatar_url,
     )
     db.add(profile)
-    db.commit()
-    db.refresh(profile)
+    await db.commit()
+    await db.refresh(profile)
     return profile
 
 
-def update_profile(db: Session, profile: models.Profile, update_in: schemas.ProfileUpdate, changed_by: UUID):
-    for field, value in update_in.dict(exclude_unset=True).items():
-        old_value = getattr(profile, field)
-        if value != old_value:
-            setattr(profile, field, value)
-            history = models.ProfileHistory(
-                user_id=profile.user_id,
-                field=field,
-                old_value=str(old_value) if old_value is not None else None,
-                new_value=str(value) if value is not None else None,
-                changed_by=changed_by,
-            )
-            db.add(history)
-    db.commit()
-    db.refresh(profile)
+def _history_value(value) -> str | None:
+    return str(value) if value is not None else None
+
+
+async def update_profile(db: AsyncSession, profile: models.Profile, update_in: schemas.ProfileUpdate, changed_by: UUID):
+    changes = {
+        field: (getattr(profile, field), value)
+        for field, value in update_in.model_dump(exclude_unset=True).items()
+        if getattr(profile, field) != value
+    }
+    if not changes:
+        return profile
+
+    now = models.utcnow()
+    for field, (_, value) in changes.items():
+        setattr(profile, field, value)
+    # Set here rather than by onupdate so the loaded object is current without a refresh
+    profile.updated_at = now
+    await db.execute(
+        insert(models.ProfileHistory).values([
+            {
+                "user_id": profile.user_id,
+                "field": field,
+                "old_value": _history_value(old_value),
+                "new_value": _history_value(value),
+                "changed_at": now,
+                "changed_by": changed_by,
+            }
+            for field, (old_value, value) in changes.items()
+        ])
+    )
+    await db.commit()
+    profile_cache.invalidate(profile.user_id)
     return profile
 
 
-def list_experience_levels(db: Session) -> List[models.ExperienceLevel]:
-    return db.query(models.ExperienceLevel).order_by(models.ExperienceLevel.sequence).all()
+async def _load_experience_levels(db: AsyncSession) -> List[schemas.ExperienceLevelOut]:
+    result = await db.scalars(select(models.ExperienceLevel).order_by(models.ExperienceLevel.sequence))
+    return [schemas.ExperienceLevelOut.model_validate(level) for level in result]
+
+
+experience_levels = ReferenceCache("experience_levels", _load_experience_levels)
 
 
-def create_experience_level(db: Session, level: schemas.ExperienceLevelBase) -> models.ExperienceLevel:
+async def list_experience_levels(db: AsyncSession) -> List[schemas.ExperienceLevelOut]:
+    return await experience_levels.get(db)
+
+
+async def create_experience_level(db: AsyncSession, level: schemas.ExperienceLevelBase) -> models.ExperienceLevel:
     obj = models.ExperienceLevel(label=level.label, sequence=level.sequence)
     db.add(obj)
-    db.commit()
-    db.refresh(obj)
+    await experience_levels.bump(db)
+    await db.commit()
+    experience_levels.invalidate()
+    await db.refresh(obj)
     return obj
 
 
-def update_experience_level(db: Session, exp_id: int, level: schemas.ExperienceLevelBase) -> models.ExperienceLevel:
-    obj = db.query(models.ExperienceLevel).get(exp_id)
+async def update_experience_level(db: AsyncSession, exp_id: int, level: schemas.ExperienceLevelBase) -> models.ExperienceLevel:
+    obj = await db.get(models.ExperienceLevel, exp_id)
     if not obj:
         return None
     obj.label = level.label
     obj.sequence = level.sequence
-    db.commit()
-    db.refresh(obj)
+    await experience_levels.bump(db)
+    await db.commit()
+    experience_levels.invalidate()
     return obj
 
 
-def delete_experience_level(db: Session, exp_id: int):
-    obj = db.query(models.ExperienceLevel).get(exp_id)
+async def delete_experience_level(db: AsyncSession, exp_id: int):
+    obj = await db.get(models.ExperienceLevel, exp_id)
     if obj:
-        db.delete(obj)
-        db.commit()
+        await db.delete(obj)
+        await experience_levels.bump(db)
+        await db.commit()
+        experience_levels.invalidate()
+
 
+async def _touch_profile(db: AsyncSession, user_id: UUID):
+    """Bump ``updated_at`` so the profile ETag changes with its social accounts."""
+    await db.execute(update(models.Profile).where(models.Profile.user_id == user_id).values(updated_at=models.utcnow()))
 
-def link_social(db: Session, user_id: UUID, provider: str, provider_id: str) -> models.SocialBinding:
+
+async def link_social(db: AsyncSession, user_id: UUID, provider: str, provider_id: str) -> models.SocialBinding:
     binding = models.SocialBinding(user_id=user_id, provider=provider, provider_id=provider_id)
     db.add(binding)
-    db.commit()
-    db.refresh(binding)
+    await _touch_profile(db, user_id)
+    await db.commit()
+    profile_cache.invalidate(user_id)
+    await db.refresh(binding)
     return binding
 
 
-def unlink_social(db: Session, user_id: UUID, provider: str):
-    binding = db.query(models.SocialBinding).filter_by(user_id=user_id, provider=provider).first()
+async def unlink_social(db: AsyncSession, user_id: UUID, provider: str):
+    binding = await db.scalar(select(models.SocialBinding).filter_by(user_id=user_id, provider=provider))
     if binding:
-        db.delete(binding)
-        db.commit()
-
-
-def list_history(db: Session, user_id: UUID, skip: int = 0, limit: int = 20) -> List[models.ProfileHistory]:
-    return (
-        db.query(models.ProfileHistory)
-        .filter(models.ProfileHistory.user_id == user_id)
-        .order_by(models.ProfileHistory.changed_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+        await db.delete(binding)
+        await _touch_profile(db, user_id)
+        await db.commit()
+        profile_cache.invalidate(user_id)
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> list:
+    return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+
+
+def encode_history_cursor(entry: models.ProfileHistory) -> str:
+    return encode_cursor([entry.changed_at.isoformat(), entry.id])
+
+
+def decode_history_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of :func:`encode_history_cursor`; raises ``ValueError`` on malformed input."""
+    try:
+        changed_at, entry_id = _decode_cursor(cursor)
+        return datetime.fromisoformat(changed_at), int(entry_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+async def list_history(
+    db: AsyncSession, user_id: UUID, skip: int = 0, limit: int = 20, after: tuple[datetime, int] | None = None
+) -> List[models.ProfileHistory]:
+    """Newest first. ``after`` continues from a decoded cursor and ignores ``skip``.
+
+    Pages that run past the rows still in the table continue into the archive,
+    whose months are all older than them (see ``retention``).
+    """
+    query = select(models.ProfileHistory).where(models.ProfileHistory.user_id == user_id)
+    if after is not None:
+        query = query.where(tuple_(models.ProfileHistory.changed_at, models.ProfileHistory.id) < after)
+    else:
+        query = query.offset(skip)
+    result = await db.scalars(
+        query.order_by(models.ProfileHistory.changed_at.desc(), models.ProfileHistory.id.desc()).limit(limit)
     )
+    entries = result.all()
+    if len(entries) == limit:
+        return entries
+    if entries:
+        after, skip = (entries[-1].changed_at, entries[-1].id), 0
+    elif after is None and skip:
+        skip -= await db.scalar(
+            select(func.count()).select_from(models.ProfileHistory).where(models.ProfileHistory.user_id == user_id)
+        )
+    archived = await asyncio.to_thread(history_archive.read, str(user_id), limit - len(entries), skip, after)
+    return entries + [
+        models.ProfileHistory(
+            user_id=user_id, **{**entry, "changed_by": entry["changed_by"] and UUID(entry["changed_by"])}
+        )
+        for entry in archived
+    ]
+
+
+# External content FTS5 table kept in sync with ``profiles`` by triggers, see models
+profiles_fts = table("profiles_fts", column("rowid"))
+
+
+def _search_terms(q: str) -> list[str]:
+    return re.findall(r"\w+", q.lower())
+
+
+def decode_search_cursor(cursor: str, dialect: str) -> int | UUID:
+    """Inverse of the cursor built in :func:`search_profiles` on ``dialect``; raises ``ValueError``."""
+    try:
+        (key,) = _decode_cursor(cursor)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if dialect == "postgresql" and isinstance(key, str):
+        return UUID(key)
+    if dialect != "postgresql" and isinstance(key, int) and not isinstance(key, bool):
+        return key
+    raise ValueError("Invalid cursor")
+
+
+async def search_profiles(
+    db: AsyncSession,
+    q: str | None = None,
+    experience_id: int | None = None,
+    country: str | None = None,
+    limit: int = 20,
+    after: int | UUID | None = None,
+) -> tuple[List[models.Profile], str | None]:
+    """Profiles whose text fields contain words starting with every word of ``q``.
+
+    Results come in key order (rowid on SQLite, user_id on PostgreSQL) so pages
+    continue from a cursor; returns the page and the cursor for the next one.
+    """
+    terms = _search_terms(q or "")
+    query = select(models.Profile)
+    if experience_id is not None:
+        query = query.where(models.Profile.experience_id == experience_id)
+    if country:
+        query = query.where(models.Profile.country == country)
+
+    if db.get_bind().dialect.name == "postgresql":
+        rows = await _search_postgresql(db, query, terms, limit, after)
+    else:
+        key = literal_column("profiles.rowid")
+        if terms:
+            key = profiles_fts.c.rowid
+            match = " ".join(f'"{term}"*' for term in terms)
+            query = query.join(profiles_fts, profiles_fts.c.rowid == literal_column("profiles.rowid")).where(
+                literal_column("profiles_fts").op("MATCH")(match)
+            )
+        if after is not None:
+            query = query.where(key > after)
+        rows = (await db.execute(query.add_columns(key).order_by(key).limit(limit))).all()
+
+    profiles = [profile for profile, _ in rows]
+    next_cursor = None
+    if len(rows) == limit:
+        last_key = rows[-1][1]
+        next_cursor = encode_cursor([last_key if isinstance(last_key, int) else str(last_key)])
+    return profiles, next_cursor
+
+
+# Profiles a PostgreSQL search reads in user_id order before it falls back to sorting every match
+SEARCH_PROBE_ROWS = 5000
+
+
+async def _search_postgresql(db: AsyncSession, query, terms: list[str], limit: int, after: UUID | None) -> list:
+    """``(profile, user_id)`` rows of a search page on PostgreSQL; ``query`` holds the filters.
+
+    The GIN index returns matches in no order, and the planner cannot estimate
+    how many a prefix term has: it walks the primary key for rare words and
+    sorts every match of common ones, both slow on a large table. So the order
+    is chosen here. The next ``SEARCH_PROBE_ROWS`` filtered profiles by user_id
+    (a range of the primary key, or of a filter's composite index) hold a full
+    page of any broad query. When they do not, the query is selective, and
+    its matches are collected through the GIN index and sorted.
+    """
+    key = models.Profile.user_id
+    if after is not None:
+        query = query.where(key > after)
+    if not terms:
+        return (await db.execute(query.add_columns(key).order_by(key).limit(limit))).all()
+
+    tsquery = func.to_tsquery(models.SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+    window = query.add_columns(models.search_vector).order_by(key).limit(SEARCH_PROBE_ROWS).subquery()
+    profile = aliased(models.Profile, window)
+    probe = select(profile, profile.user_id).where(window.c.search_vector.op("@@")(tsquery))
+    rows = (await db.execute(probe.order_by(profile.user_id).limit(limit))).all()
+    if len(rows) == limit:
+        return rows
+    query = query.where(models.search_vector.op("@@")(tsquery))
+    # Materialized, so that the planner cannot go back to walking the primary key
+    matches = aliased(models.Profile, query.cte("matches").prefix_with("MATERIALIZED"))
+    return (await db.execute(select(matches, matches.user_id).order_by(matches.user_id).limit(limit))).all()
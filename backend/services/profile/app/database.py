@@ -1,12 +1,48 @@
-from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
-DATABASE_URL = os.getenv("PROFILE_DATABASE_URL", "sqlite:///./profile.db")
+# Plain URLs are mapped to the async driver of the same database
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+DATABASE_URL = make_url(os.getenv("PROFILE_DATABASE_URL", "sqlite:///./profile.db"))
+DATABASE_URL = DATABASE_URL.set(drivername=ASYNC_DRIVERS.get(DATABASE_URL.drivername, DATABASE_URL.drivername))
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine_options = {}
+if DATABASE_URL.get_backend_name() != "sqlite":
+    engine_options = {
+        "pool_size": int(os.getenv("PROFILE_DB_POOL_SIZE", "20")),
+        "max_overflow": int(os.getenv("PROFILE_DB_MAX_OVERFLOW", "30")),
+        "pool_recycle": int(os.getenv("PROFILE_DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("PROFILE_DB_POOL_PRE_PING", "true").lower() == "true",
+        "pool_timeout": int(os.getenv("PROFILE_DB_POOL_TIMEOUT", "10")),
+    }
+
+engine = create_async_engine(DATABASE_URL, **engine_options)
+
+AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
+
+async def get_session() -> AsyncSession:
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+def _create_schema(conn):
+    Base.metadata.create_all(bind=conn)
+    # create_all skips tables that already exist, so add indexes introduced later
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_schema)
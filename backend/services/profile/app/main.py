@@ -1,16 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from typing import List
-import shutil
+from typing import List, Optional
+import io
+import json
+import logging
 import os
+import tempfile
 
-from .database import SessionLocal, engine, Base
-from . import models, schemas, crud
+from .database import AsyncSessionLocal, get_session, init_db
+from . import avatars, bulk, models, schemas, crud, retention, thumbnails
+from .cache import profile_cache
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
 ROOT_PATH = os.getenv("ROOT_PATH", "")
+# Avatar variants are content addressed, so they never change under the same URL
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Import bodies larger than this are buffered on disk rather than in memory
+IMPORT_SPOOL_SIZE = 8 * 1024 * 1024
 app = FastAPI(
     title="Profile Service",
     root_path=ROOT_PATH,
@@ -20,86 +29,231 @@ app = FastAPI(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@app.on_event("startup")
+async def startup_event():
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        await retention.ensure_partitions(db)
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    thumbnails.shutdown()
+
+
+def _etag(profile: models.Profile) -> str:
+    return f'"{int(profile.updated_at.timestamp() * 1_000_000):x}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an ``If-None-Match`` list, which may hold ``*`` or ``W/`` tags."""
+    tags = [tag.strip() for tag in (if_none_match or "").split(",")]
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
 
 
 @app.get("/api/profile", response_model=schemas.ProfileOut)
-def read_profile(user_id: UUID, db: Session = Depends(get_db)):
-    profile = crud.get_profile(db, user_id)
-    if not profile:
-        raise HTTPException(status_code=404, detail="Profile not found")
-    return profile
+async def read_profile(user_id: UUID, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_session)):
+    cached = profile_cache.get(user_id)
+    if cached:
+        etag, body = cached
+    else:
+        profile = await crud.get_profile(db, user_id)
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        etag = _etag(profile)
+        body = schemas.ProfileOut.model_validate(profile).model_dump_json().encode()
+        profile_cache.set(user_id, etag, body)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+@app.get("/api/profile/search", response_model=List[schemas.ProfileOut])
+async def search_profiles(
+    response: Response,
+    q: Optional[str] = None,
+    experience_id: Optional[int] = None,
+    country: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_session),
+):
+    """Prefix search over names, nickname, company, city and position; pass ``X-Next-Cursor`` back as ``cursor``."""
+    try:
+        after = crud.decode_search_cursor(cursor, db.get_bind().dialect.name) if cursor else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    profiles, next_cursor = await crud.search_profiles(db, q, experience_id, country, limit, after)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return profiles
+
+
+@app.post("/api/profile/batch", response_model=List[schemas.ProfileBatchItem])
+async def read_profiles(batch: schemas.ProfileBatchRequest, db: AsyncSession = Depends(get_session)):
+    profiles = await crud.get_profiles(db, batch.user_ids)
+    return [
+        schemas.ProfileBatchItem(user_id=user_id, found=user_id in profiles, profile=profiles.get(user_id))
+        for user_id in batch.user_ids
+    ]
 
 
 @app.put("/api/profile", response_model=schemas.ProfileOut)
-def update_profile(user_id: UUID, profile_update: schemas.ProfileUpdate, db: Session = Depends(get_db)):
-    profile = crud.get_profile(db, user_id)
+async def update_profile(user_id: UUID, profile_update: schemas.ProfileUpdate, db: AsyncSession = Depends(get_session)):
+    profile = await crud.get_profile(db, user_id)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-    updated = crud.update_profile(db, profile, profile_update, changed_by=user_id)
+    updated = await crud.update_profile(db, profile, profile_update, changed_by=user_id)
     return updated
 
 
-@app.post("/api/profile/avatar", response_model=dict)
-def upload_avatar(user_id: UUID, file: UploadFile = File(...), db: Session = Depends(get_db)):
-    if file.content_type not in ("image/jpeg", "image/png"):
-        raise HTTPException(status_code=400, detail="Invalid image type")
-    contents = file.file.read()
-    if len(contents) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File too large")
-    path = f"avatars/{user_id}_{file.filename}"
-    os.makedirs("avatars", exist_ok=True)
-    with open(path, "wb") as f:
-        f.write(contents)
-    profile = crud.get_profile(db, user_id)
+async def _generate_thumbnails(path: str):
+    try:
+        await thumbnails.generate_async(path)
+    except Exception:
+        logger.exception("thumbnail generation failed for %s", path)
+
+
+# The body is parsed from the stream by the handler, so the form is described here for the docs
+AVATAR_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
+
+@app.post("/api/profile/avatar", response_model=dict, openapi_extra=AVATAR_UPLOAD_BODY)
+async def upload_avatar(user_id: UUID, request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_session)):
+    length = request.headers.get("content-length", "")
+    try:
+        if length.isdigit() and int(length) > avatars.MAX_AVATAR_SIZE + avatars.MULTIPART_OVERHEAD:
+            # Declared too large: refuse before reading any of the body
+            raise avatars.AvatarTooLarge("File too large")
+        path = await avatars.store_multipart(request.stream(), request.headers.get("content-type", ""))
+    except avatars.AvatarError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    profile = await crud.get_profile(db, user_id)
     if not profile:
-        profile = crud.create_profile(db, schemas.ProfileCreate(user_id=user_id, first_name=""))
-    crud.update_profile(db, profile, schemas.ProfileUpdate(avatar_url=path), changed_by=user_id)
-    return {"avatar_url": path}
+        profile = await crud.create_profile(db, schemas.ProfileCreate(user_id=user_id, first_name=""))
+    await crud.update_profile(db, profile, schemas.ProfileUpdate(first_name=profile.first_name, avatar_url=path), changed_by=user_id)
+    background_tasks.add_task(_generate_thumbnails, path)
+    return {"avatar_url": path, "thumbnails": thumbnails.variant_urls(path)}
+
+
+@app.get("/api/profile/avatars/{name}")
+async def avatar_thumbnail(name: str):
+    variant = thumbnails.parse_variant(name)
+    if not variant:
+        raise HTTPException(status_code=404, detail="Not found")
+    digest, _, ext = variant
+    path = os.path.join(avatars.AVATAR_DIR, name)
+    if not os.path.exists(path):
+        # Requested before the background job finished, or the variant was removed
+        original = avatars.find(digest)
+        if original is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        try:
+            await thumbnails.generate_async(original)
+        except thumbnails.UnreadableImage:
+            logger.warning("avatar %s cannot be decoded", original)
+            raise HTTPException(status_code=404, detail="Not found")
+    media_type = "image/webp" if ext == "webp" else "image/jpeg"
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
 
 
 @app.get("/api/experience-levels", response_model=List[schemas.ExperienceLevelOut])
-def list_levels(db: Session = Depends(get_db)):
-    return crud.list_experience_levels(db)
+async def list_levels(db: AsyncSession = Depends(get_session)):
+    return await crud.list_experience_levels(db)
 
 
 @app.post("/api/experience-levels", response_model=schemas.ExperienceLevelOut)
-def create_level(level: schemas.ExperienceLevelBase, db: Session = Depends(get_db)):
-    return crud.create_experience_level(db, level)
+async def create_level(level: schemas.ExperienceLevelBase, db: AsyncSession = Depends(get_session)):
+    return await crud.create_experience_level(db, level)
 
 
 @app.put("/api/experience-levels/{level_id}", response_model=schemas.ExperienceLevelOut)
-def update_level(level_id: int, level: schemas.ExperienceLevelBase, db: Session = Depends(get_db)):
-    updated = crud.update_experience_level(db, level_id, level)
+async def update_level(level_id: int, level: schemas.ExperienceLevelBase, db: AsyncSession = Depends(get_session)):
+    updated = await crud.update_experience_level(db, level_id, level)
     if not updated:
         raise HTTPException(status_code=404, detail="Not found")
     return updated
 
 
 @app.delete("/api/experience-levels/{level_id}")
-def delete_level(level_id: int, db: Session = Depends(get_db)):
-    crud.delete_experience_level(db, level_id)
+async def delete_level(level_id: int, db: AsyncSession = Depends(get_session)):
+    await crud.delete_experience_level(db, level_id)
     return {"ok": True}
 
 
 @app.post("/api/profile/social/link", response_model=schemas.SocialBindingOut)
-def link_social(user_id: UUID, provider: str, provider_id: str, db: Session = Depends(get_db)):
-    return crud.link_social(db, user_id, provider, provider_id)
+async def link_social(user_id: UUID, provider: str, provider_id: str, db: AsyncSession = Depends(get_session)):
+    return await crud.link_social(db, user_id, provider, provider_id)
 
 
 @app.delete("/api/profile/social/{provider}")
-def unlink_social(provider: str, user_id: UUID, db: Session = Depends(get_db)):
-    crud.unlink_social(db, user_id, provider)
+async def unlink_social(provider: str, user_id: UUID, db: AsyncSession = Depends(get_session)):
+    await crud.unlink_social(db, user_id, provider)
     return {"ok": True}
 
 
-@app.get("/api/profile/history", response_model=List[schemas.ProfileHistoryOut])
-def profile_history(user_id: UUID, page: int = 1, per_page: int = 20, db: Session = Depends(get_db)):
-    skip = (page - 1) * per_page
-    return crud.list_history(db, user_id, skip=skip, limit=per_page)
+@app.get("/internal/profile/export")
+async def export_profiles(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Stream every profile ordered by user_id without loading the table into memory."""
+
+    async def rows():
+        async with AsyncSessionLocal() as db:
+            async for chunk in bulk.export_profiles(db, format):
+                yield chunk
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(rows(), media_type=media_type)
+
 
+@app.post("/internal/profile/import")
+async def import_profiles(request: Request):
+    """Upsert profiles from an NDJSON or CSV body, streaming one NDJSON result per row."""
+    fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    # Spool the body first: it cannot be read once the response has started
+    body = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+    async for chunk in request.stream():
+        body.write(chunk)
+    body.seek(0)
+    text = io.TextIOWrapper(body, encoding="utf-8", newline="")
+
+    async def results():
+        with text:
+            async with AsyncSessionLocal() as db:
+                async for result in bulk.import_profiles(db, bulk.parse_rows(text, fmt)):
+                    yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/internal/profile/metrics")
+async def metrics():
+    return {"profile_cache": profile_cache.stats()}
+
+
+@app.get("/api/profile/history", response_model=List[schemas.ProfileHistoryOut])
+async def profile_history(
+    user_id: UUID,
+    response: Response,
+    page: int = 1,
+    per_page: int = 20,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_session),
+):
+    """Offset pages via ``page``, or pass the previous ``X-Next-Cursor`` header as ``cursor``."""
+    try:
+        after = crud.decode_history_cursor(cursor) if cursor else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    entries = await crud.list_history(db, user_id, skip=(page - 1) * per_page, limit=per_page, after=after)
+    if len(entries) == per_page:
+        response.headers["X-Next-Cursor"] = crud.encode_history_cursor(entries[-1])
+    return entries
@@ -1,11 +1,19 @@
-from sqlalchemy import Column, String, Date, Integer, ForeignKey, DateTime, func, Enum, Text
+from sqlalchemy import (
+    Column, String, Date, Integer, ForeignKey, DateTime, func, Enum, Text, Index, event, literal_column, column,
+    DDL, PrimaryKeyConstraint, UniqueConstraint,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
+from datetime import datetime, timezone
 
 from .database import Base
 
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class ExperienceLevel(Base):
     __tablename__ = "experience_levels"
     id = Column(Integer, primary_key=True, index=True)
@@ -13,6 +21,12 @@ class ExperienceLevel(Base):
     sequence = Column(Integer, nullable=False)
 
 
+# Profile text searched by ``crud.search_profiles``. SQLite indexes it with the
+# FTS5 table below, PostgreSQL with a GIN index on a stored tsvector column.
+SEARCH_FIELDS = ("first_name", "nickname", "company", "city", "position")
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+
+
 class Profile(Base):
     __tablename__ = "profiles"
     user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -26,10 +40,85 @@ class Profile(Base):
     position = Column(String(150))
     experience_id = Column(Integer, ForeignKey("experience_levels.id"))
     avatar_url = Column(String(255))
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Set in Python for microsecond precision on every backend, since it is the ETag
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), default=utcnow, onupdate=utcnow)
 
     experience = relationship("ExperienceLevel")
-    social_accounts = relationship("SocialBinding", back_populates="profile")
+    # Always serialized with the profile, and async sessions cannot lazy load
+    social_accounts = relationship("SocialBinding", back_populates="profile", lazy="selectin")
+
+    __table_args__ = (
+        # Filtered searches read these in key order: SQLite appends the rowid to every index
+        Index("ix_profiles_country", "country").ddl_if(dialect="sqlite"),
+        Index("ix_profiles_experience_id", "experience_id").ddl_if(dialect="sqlite"),
+        Index("ix_profiles_country_user_id", "country", "user_id").ddl_if(dialect="postgresql"),
+        Index("ix_profiles_experience_id_user_id", "experience_id", "user_id").ddl_if(dialect="postgresql"),
+    )
+
+
+# Not mapped, since SQLite has no tsvector; _create_postgresql_search adds it
+search_vector = column("search_vector")
+
+
+_FTS_COLUMNS = ", ".join(SEARCH_FIELDS)
+_FTS_NEW = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+_FTS_OLD = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+# prefix='2 3' keeps short prefix queries from scanning the whole term list
+SQLITE_SEARCH_TABLE = (
+    f"CREATE VIRTUAL TABLE profiles_fts USING fts5({_FTS_COLUMNS}, content='profiles', content_rowid='rowid',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+SQLITE_SEARCH_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS profiles_fts_insert AFTER INSERT ON profiles BEGIN"
+    f" INSERT INTO profiles_fts(rowid, {_FTS_COLUMNS}) VALUES (new.rowid, {_FTS_NEW}); END",
+    f"CREATE TRIGGER IF NOT EXISTS profiles_fts_delete AFTER DELETE ON profiles BEGIN"
+    f" INSERT INTO profiles_fts(profiles_fts, rowid, {_FTS_COLUMNS}) VALUES ('delete', old.rowid, {_FTS_OLD}); END",
+    f"CREATE TRIGGER IF NOT EXISTS profiles_fts_update AFTER UPDATE OF {_FTS_COLUMNS} ON profiles BEGIN"
+    f" INSERT INTO profiles_fts(profiles_fts, rowid, {_FTS_COLUMNS}) VALUES ('delete', old.rowid, {_FTS_OLD});"
+    f" INSERT INTO profiles_fts(rowid, {_FTS_COLUMNS}) VALUES (new.rowid, {_FTS_NEW}); END",
+)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_sqlite_search(target, connection, **kw):
+    """Create the FTS5 index and its triggers, indexing existing profiles the first time."""
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'profiles_fts'").first()
+    if not exists:
+        connection.exec_driver_sql(SQLITE_SEARCH_TABLE)
+    for trigger in SQLITE_SEARCH_TRIGGERS:
+        connection.exec_driver_sql(trigger)
+    if not exists:
+        connection.exec_driver_sql("INSERT INTO profiles_fts(profiles_fts) VALUES ('rebuild')")
+
+
+_PG_DOCUMENT = " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+POSTGRESQL_SEARCH_COLUMN = (
+    f"ALTER TABLE profiles ADD COLUMN search_vector tsvector"
+    f" GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, {_PG_DOCUMENT})) STORED"
+)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_postgresql_search(target, connection, **kw):
+    """Add the stored search column and its GIN index.
+
+    Earlier versions indexed the tsvector expression instead, and the filter
+    columns without ``user_id``; those indexes are dropped, and adding the
+    column rewrites ``profiles`` once.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM information_schema.columns"
+        " WHERE table_schema = current_schema() AND table_name = 'profiles' AND column_name = 'search_vector'"
+    ).first()
+    if not exists:
+        for index in ("ix_profiles_search", "ix_profiles_country", "ix_profiles_experience_id"):
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index}")
+        connection.exec_driver_sql(POSTGRESQL_SEARCH_COLUMN)
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_profiles_search ON profiles USING gin (search_vector)")
 
 
 class SocialBinding(Base):
@@ -44,12 +133,42 @@ class SocialBinding(Base):
 
 
 class ProfileHistory(Base):
+    """Field changes, partitioned by month of ``changed_at`` on PostgreSQL.
+
+    Partitions are created ahead of time and archived by ``retention``; rows
+    outside every monthly partition land in ``profile_history_default``.
+    """
     __tablename__ = "profile_history"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("profiles.user_id"))
     field = Column(String(50), nullable=False)
     old_value = Column(Text)
     new_value = Column(Text)
-    changed_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set in Python so every row has the same precision; keyset cursors compare on it
+    changed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), default=utcnow)
     changed_by = Column(UUID(as_uuid=True), nullable=True)
 
+    __table_args__ = (
+        # A unique key on a partitioned table must include the partition column
+        PrimaryKeyConstraint("id").ddl_if(dialect="sqlite"),
+        UniqueConstraint("id", "changed_at").ddl_if(dialect="postgresql"),
+        # Serves history pages in (changed_at, id) order without sorting
+        Index("ix_profile_history_user_changed", "user_id", "changed_at", "id"),
+        # Lets the retention job find a month's rows; PostgreSQL prunes partitions instead
+        Index("ix_profile_history_changed_at", "changed_at").ddl_if(dialect="sqlite"),
+        {"postgresql_partition_by": "RANGE (changed_at)"},
+    )
+
+
+event.listen(
+    ProfileHistory.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS profile_history_default PARTITION OF profile_history DEFAULT").execute_if(dialect="postgresql"),
+)
+
+
+class ReferenceVersion(Base):
+    """Version counter per cached reference table, see ``refcache``."""
+    __tablename__ = "reference_versions"
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,54 @@
+"""In-process cache for small reference tables.
+
+Each cached table has a row in ``reference_versions``. Writers bump the
+version in the same transaction as their change; readers serve from memory and
+compare the stored version at most every ``PROFILE_REFERENCE_CHECK_INTERVAL``
+seconds, reloading the table only when it moved. A write is visible at once in
+the worker that made it and within the interval everywhere else.
+"""
+import os
+import time
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ReferenceVersion
+
+REFERENCE_CHECK_INTERVAL = float(os.getenv("PROFILE_REFERENCE_CHECK_INTERVAL", "5"))
+
+T = TypeVar("T")
+
+
+class ReferenceCache(Generic[T]):
+    def __init__(self, name: str, load: Callable[[AsyncSession], Awaitable[T]], check_interval: float = REFERENCE_CHECK_INTERVAL):
+        self.name = name
+        self.load = load
+        self.check_interval = check_interval
+        self._value: T | None = None
+        self._version: int | None = None
+        self._checked_at = 0.0
+
+    async def get(self, db: AsyncSession) -> T:
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return self._value
+        version = await db.scalar(select(ReferenceVersion.version).where(ReferenceVersion.name == self.name)) or 0
+        if version != self._version:
+            self._value = await self.load(db)
+            self._version = version
+        self._checked_at = now
+        return self._value
+
+    async def bump(self, db: AsyncSession):
+        """Increment the stored version; call before committing the change it covers."""
+        insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(ReferenceVersion).values(name=self.name, version=1)
+        await db.execute(stmt.on_conflict_do_update(index_elements=[ReferenceVersion.name], set_={"version": ReferenceVersion.version + 1}))
+
+    def invalidate(self):
+        """Drop the local copy; call after the commit that bumped the version."""
+        self._version = None
+        self._value = None
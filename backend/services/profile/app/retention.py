@@ -0,0 +1,271 @@
+"""Move profile history older than the retention window into the archive.
+
+History is partitioned by calendar month (UTC) of ``changed_at``. Each month
+that ended more than ``PROFILE_HISTORY_RETENTION_MONTHS`` months ago is copied
+into the archive (see ``archive``) as one rollup per user, then removed from
+the database: on PostgreSQL by detaching and dropping its partition, on SQLite
+by deleting the month's rows in chunks. On PostgreSQL the job also creates the
+partitions for the coming months before any row needs them. Nothing is
+archived until ``PROFILE_HISTORY_ARCHIVE`` is set. The job runs from the
+command line, once or every ``--every`` seconds, as a single process beside
+the service::
+
+    python -m app.retention --retention-months 12 --every 86400
+
+A PostgreSQL ``profile_history`` created before it was partitioned is left as
+it is, with a warning, until ``python -m app.retention --partition`` moves it
+into a partitioned table.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .archive import history_archive, utc
+from .database import AsyncSessionLocal
+from .models import ProfileHistory, utcnow
+
+logger = logging.getLogger(__name__)
+
+RETENTION_MONTHS = int(os.getenv("PROFILE_HISTORY_RETENTION_MONTHS", "12"))
+PARTITIONS_AHEAD = 3
+BATCH_SIZE = 10_000
+
+history = ProfileHistory.__table__
+PARTITION_NAME = re.compile(r"^profile_history_(\d{4})_(\d{2})$")
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(month: date) -> tuple[datetime, datetime]:
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    end = add_months(month, 1)
+    return start, datetime(end.year, end.month, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: date) -> str:
+    return f"profile_history_{month:%Y_%m}"
+
+
+def _is_postgres(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+async def _is_partitioned(db: AsyncSession) -> bool:
+    """Whether ``profile_history`` is partitioned; a table created by an earlier version is not."""
+    return bool(await db.scalar(text(
+        "SELECT count(*) FROM pg_partitioned_table WHERE partrelid = 'profile_history'::regclass"
+    )))
+
+
+UNPARTITIONED = (
+    "profile_history was created before it was partitioned, so its history is neither partitioned nor archived;"
+    " run `python -m app.retention --partition` to migrate it"
+)
+NO_ARCHIVE = "PROFILE_HISTORY_ARCHIVE is not set, so profile history is kept in the database and not archived"
+
+
+async def _create_partition(db: AsyncSession, month: date):
+    start, end = month_range(month)
+    await db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF profile_history"
+        f" FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+
+
+async def ensure_partitions(db: AsyncSession, now: datetime | None = None, ahead: int = PARTITIONS_AHEAD):
+    """Create the current month's partition and ``ahead`` more; no-op outside PostgreSQL.
+
+    Logs a warning instead when ``profile_history`` is not partitioned.
+    """
+    if not _is_postgres(db):
+        return
+    if not await _is_partitioned(db):
+        logger.warning(UNPARTITIONED)
+        return
+    current = month_start(now or utcnow())
+    for offset in range(ahead + 1):
+        await _create_partition(db, add_months(current, offset))
+    await db.commit()
+
+
+async def partition_history(db: AsyncSession, now: datetime | None = None) -> int:
+    """Replace an unpartitioned PostgreSQL ``profile_history`` with a partitioned one; returns rows moved.
+
+    One transaction: the old table is renamed, the new one created with a
+    partition for every month it has rows in, and the rows copied across.
+    Writers wait on the lock until it commits.
+    """
+    if not _is_postgres(db) or await _is_partitioned(db):
+        return 0
+    old = "profile_history_unpartitioned"
+    await db.execute(text(f"ALTER TABLE profile_history RENAME TO {old}"))
+    # Index names are per schema, and the new table's are the same
+    indexes = await db.scalars(text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": old})
+    for index in indexes.all():
+        await db.execute(text(f'ALTER INDEX "{index}" RENAME TO "{old}_{index}"'))
+    await (await db.connection()).run_sync(history.create)
+
+    current = month_start(now or utcnow())
+    months = {add_months(current, offset) for offset in range(PARTITIONS_AHEAD + 1)}
+    starts = await db.scalars(text(f"SELECT DISTINCT date_trunc('month', changed_at AT TIME ZONE 'UTC') FROM {old}"))
+    months.update(month_start(start) for start in starts.all() if start is not None)
+    for month in sorted(months):
+        await _create_partition(db, month)
+
+    columns = ", ".join(column.name for column in history.columns)
+    moved = (await db.execute(text(f"INSERT INTO profile_history ({columns}) SELECT {columns} FROM {old}"))).rowcount
+    await db.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('profile_history', 'id'), (SELECT coalesce(max(id), 0) + 1 FROM {old}), false)"
+    ))
+    await db.execute(text(f"DROP TABLE {old}"))
+    await db.commit()
+    return moved
+
+
+async def _oldest_month(db: AsyncSession) -> date | None:
+    if not _is_postgres(db):
+        oldest = await db.scalar(select(func.min(history.c.changed_at)))
+        return month_start(utc(oldest)) if oldest else None
+    # min(changed_at) over every partition would scan them all; the partition
+    # names say which months exist, and the default partition is small
+    names = await db.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = 'profile_history'::regclass"
+    ))
+    months = [date(int(m[1]), int(m[2]), 1) for m in map(PARTITION_NAME.match, names) if m]
+    oldest_default = await db.scalar(text("SELECT min(changed_at) FROM profile_history_default"))
+    if oldest_default:
+        months.append(month_start(utc(oldest_default)))
+    return min(months, default=None)
+
+
+def _entry(row) -> dict:
+    return {
+        "id": row.id,
+        "field": row.field,
+        "old_value": row.old_value,
+        "new_value": row.new_value,
+        "changed_at": utc(row.changed_at).isoformat(),
+        "changed_by": str(row.changed_by) if row.changed_by else None,
+    }
+
+
+async def archive_month(db: AsyncSession, month: date, batch_size: int = BATCH_SIZE) -> int:
+    """Copy ``month`` into the archive, then remove it from the database; returns rows moved."""
+    start, end = month_range(month)
+    in_month = (history.c.changed_at >= start) & (history.c.changed_at < end)
+    key = f"{month:%Y-%m}"
+
+    # Ordered by user so each user's month is contiguous and becomes one rollup
+    result = await db.stream(
+        select(history)
+        .where(in_month)
+        .order_by(history.c.user_id, history.c.changed_at.desc(), history.c.id.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    rollups, user_id, entries, pending, moved = [], None, [], 0, 0
+    async for row in result:
+        if row.user_id != user_id:
+            if entries:
+                rollups.append((str(user_id), entries))
+                if pending >= batch_size:
+                    await asyncio.to_thread(history_archive.write, key, rollups)
+                    rollups, pending = [], 0
+            user_id, entries = row.user_id, []
+        entries.append(_entry(row))
+        pending += 1
+        moved += 1
+    if entries:
+        rollups.append((str(user_id), entries))
+    if rollups:
+        await asyncio.to_thread(history_archive.write, key, rollups)
+    await asyncio.to_thread(history_archive.finish, key)
+    # Ends the cursor's transaction; PostgreSQL will not drop a partition it has open
+    await db.commit()
+
+    if _is_postgres(db):
+        name = partition_name(month)
+        if await db.scalar(text("SELECT to_regclass(:name)"), {"name": name}):
+            await db.execute(text(f"ALTER TABLE profile_history DETACH PARTITION {name}"))
+            await db.execute(text(f"DROP TABLE {name}"))
+    # The whole month on SQLite; on PostgreSQL only rows that fell into the default partition
+    while True:
+        chunk = select(history.c.id).where(in_month).limit(batch_size)
+        deleted = await db.execute(delete(history).where(history.c.id.in_(chunk), in_month))
+        await db.commit()
+        if deleted.rowcount < batch_size:
+            return moved
+
+
+async def archive_expired(db: AsyncSession, retention_months: int = RETENTION_MONTHS, now: datetime | None = None) -> dict[str, int]:
+    """Archive every month older than the retention window; returns rows moved per month."""
+    now = now or utcnow()
+    if _is_postgres(db) and not await _is_partitioned(db):
+        logger.warning(UNPARTITIONED)
+        return {}
+    await ensure_partitions(db, now)
+    if not history_archive.path:
+        logger.warning(NO_ARCHIVE)
+        return {}
+    cutoff = add_months(month_start(now), -retention_months)
+    month = await _oldest_month(db)
+    moved = {}
+    while month is not None and month < cutoff:
+        moved[f"{month:%Y-%m}"] = await archive_month(db, month)
+        month = add_months(month, 1)
+    return moved
+
+
+async def run_once(retention_months: int = RETENTION_MONTHS) -> dict[str, int]:
+    async with AsyncSessionLocal() as db:
+        moved = await archive_expired(db, retention_months)
+    logger.info("archived profile history: %s", moved)
+    return moved
+
+
+async def run_partition() -> int:
+    async with AsyncSessionLocal() as db:
+        return await partition_history(db)
+
+
+async def run_periodically(interval: int, retention_months: int = RETENTION_MONTHS):
+    while True:
+        try:
+            await run_once(retention_months)
+        except Exception:
+            logger.exception("archiving profile history failed")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive profile history older than the retention window")
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    parser.add_argument("--every", type=int, default=0, metavar="SECONDS", help="keep running, once every SECONDS")
+    parser.add_argument("--partition", action="store_true", help="partition a profile_history created by an earlier version")
+    args = parser.parse_args()
+    if args.partition:
+        print(f"{asyncio.run(run_partition())} rows moved into the partitioned profile_history")
+        return
+    if args.every:
+        logging.basicConfig(level=logging.INFO)
+        asyncio.run(run_periodically(args.every, args.retention_months))
+        return
+    for month, count in asyncio.run(run_once(args.retention_months)).items():
+        print(f"{month}: {count} rows archived")
+
+
+if __name__ == "__main__":
+    main()
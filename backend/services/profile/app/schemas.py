@@ -1,7 +1,12 @@
 from datetime import date, datetime
 from typing import Optional, List
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, computed_field
 from uuid import UUID
+import os
+
+from . import thumbnails
+
+MAX_BATCH_SIZE = int(os.getenv("PROFILE_BATCH_MAX_SIZE", "1000"))
 
 
 class SocialBindingOut(BaseModel):
@@ -38,6 +43,22 @@ class ProfileOut(ProfileBase):
     user_id: UUID
     social_accounts: List[SocialBindingOut] = []
 
+    @computed_field
+    @property
+    def avatar_thumbnails(self) -> Optional[dict[str, dict[str, str]]]:
+        """Resized avatar URLs by format and size; lists should load these, not ``avatar_url``."""
+        return thumbnails.variant_urls(self.avatar_url)
+
+
+class ProfileBatchRequest(BaseModel):
+    user_ids: List[UUID] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class ProfileBatchItem(BaseModel):
+    user_id: UUID
+    found: bool
+    profile: Optional[ProfileOut] = None
+
 
 class ExperienceLevelBase(BaseModel):
     label: str
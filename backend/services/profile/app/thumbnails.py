@@ -0,0 +1,98 @@
+"""Resized avatar variants, generated in worker processes.
+
+Every stored avatar ``<sha256>.<ext>`` gets square variants
+``<sha256>_<size>.<format>`` next to it for each of ``SIZES`` and ``FORMATS``.
+Since the original is content addressed, a variant never changes once written
+and can be cached by clients forever.
+"""
+import asyncio
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+SIZES = (32, 64, 256)
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+THUMBNAIL_WORKERS = int(os.getenv("PROFILE_THUMBNAIL_WORKERS", os.cpu_count() or 1))
+URL_PREFIX = os.getenv("ROOT_PATH", "") + "/api/profile/avatars"
+VARIANT_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})_(?P<size>\d+)\.(?P<ext>[a-z]+)$")
+ORIGINAL_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})\.[a-z]+$")
+
+
+class UnreadableImage(Exception):
+    """The stored original could not be decoded."""
+
+
+def variant_name(digest: str, size: int, ext: str) -> str:
+    return f"{digest}_{size}.{ext}"
+
+
+def parse_variant(name: str) -> tuple[str, int, str] | None:
+    """Split a variant file name into ``(digest, size, ext)``; None if it is not one we produce."""
+    match = VARIANT_NAME.match(name)
+    if not match or int(match["size"]) not in SIZES or match["ext"] not in FORMATS:
+        return None
+    return match["digest"], int(match["size"]), match["ext"]
+
+
+def variant_urls(path: str | None) -> dict[str, dict[str, str]] | None:
+    """URLs of every variant of the stored avatar at ``path``, by format and size.
+
+    None for anything that is not a content-addressed original, such as an
+    ``avatar_url`` set by hand.
+    """
+    match = ORIGINAL_NAME.match(os.path.basename(path or ""))
+    if not match:
+        return None
+    return {
+        ext: {str(size): f"{URL_PREFIX}/{variant_name(match['digest'], size, ext)}" for size in SIZES}
+        for ext in FORMATS
+    }
+
+
+def generate(path: str) -> list[str]:
+    """Write every missing variant of the avatar at ``path`` and return all variant paths."""
+    directory, filename = os.path.split(path)
+    digest = filename.split(".", 1)[0]
+    paths = []
+    try:
+        with Image.open(path) as original:
+            # Let the JPEG decoder downscale while decoding instead of loading full size
+            original.draft("RGB", (max(SIZES), max(SIZES)))
+            image = ImageOps.exif_transpose(original).convert("RGB")
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as exc:
+        raise UnreadableImage(f"{filename}: {exc}") from None
+    for size in SIZES:
+        thumb = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        for ext, fmt in FORMATS.items():
+            target = os.path.join(directory, variant_name(digest, size, ext))
+            paths.append(target)
+            if os.path.exists(target):
+                continue
+            tmp = f"{target}.{os.getpid()}.part"
+            thumb.save(tmp, fmt, quality=85)
+            os.replace(tmp, target)
+    return paths
+
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    return _executor
+
+
+async def generate_async(path: str) -> list[str]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), generate, path)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
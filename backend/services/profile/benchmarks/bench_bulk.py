@@ -0,0 +1,109 @@
+"""Measure bulk profile import and export throughput over SQLite.
+
+Imports ``--rows`` new profiles as NDJSON, re-imports the same file with a
+tenth of the rows changed (so the update and history paths run), then exports
+the table as NDJSON and CSV. Peak RSS is printed after each step.
+
+Run from ``backend/``::
+
+    python services/profile/benchmarks/bench_bulk.py --rows 1000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.profile.app import bulk
+from services.profile.app.database import Base
+
+CITIES = ["moscow", "kazan", "omsk", "tomsk", "samara", "perm", "ufa", "sochi", "tver", "kaluga"]
+
+
+def random_uuid(rng: random.Random) -> uuid.UUID:
+    # SQLite gives the UUID column numeric affinity, so a hex string that parses
+    # as a number would be stored as one; redraw those
+    while True:
+        value = uuid.UUID(int=rng.getrandbits(128), version=4)
+        if any(c in "abcdf" for c in value.hex):
+            return value
+
+
+def write_rows(path: str, user_ids: list[uuid.UUID], rng: random.Random, changed: float):
+    with open(path, "w") as f:
+        for i, user_id in enumerate(user_ids):
+            city = rng.choice(CITIES) if rng.random() < changed else CITIES[i % len(CITIES)]
+            f.write(json.dumps({"user_id": str(user_id), "first_name": f"User{i}", "nickname": f"user{i}", "city": city}) + "\n")
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_import(engine, path: str, label: str):
+    statuses = {}
+    start = time.perf_counter()
+    async with AsyncSession(engine) as db:
+        with open(path, encoding="utf-8", newline="") as text:
+            async for result in bulk.import_profiles(db, bulk.parse_rows(text, "ndjson")):
+                statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    elapsed = time.perf_counter() - start
+    rows = sum(statuses.values())
+    print(f"{label:<10} {rows:>9} rows {elapsed:>7.1f}s {rows / elapsed:>9.0f} rows/s  rss={peak_rss_mb():.0f}MB  {statuses}")
+
+
+async def run_export(engine, fmt: str):
+    size = 0
+    start = time.perf_counter()
+    async with AsyncSession(engine) as db:
+        async for chunk in bulk.export_profiles(db, fmt):
+            size += len(chunk)
+    elapsed = time.perf_counter() - start
+    print(f"{'export ' + fmt:<10} {size / 2**20:>7.0f} MB {elapsed:>7.1f}s {size / 2**20 / elapsed:>9.1f} MB/s   rss={peak_rss_mb():.0f}MB")
+
+
+async def bench(db_path: str, rows_path: str, changed_path: str):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    await run_import(engine, rows_path, "import")
+    await run_import(engine, changed_path, "reimport")
+    await run_export(engine, "ndjson")
+    await run_export(engine, "csv")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--changed", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "bulk.db")
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    user_ids = [random_uuid(rng) for _ in range(args.rows)]
+    rows_path, changed_path = os.path.join(directory, "rows.ndjson"), os.path.join(directory, "changed.ndjson")
+    write_rows(rows_path, user_ids, rng, changed=0)
+    write_rows(changed_path, user_ids, rng, changed=args.changed)
+    print(f"input {os.path.getsize(rows_path) / 2**20:.0f} MB, rss={peak_rss_mb():.0f}MB before import")
+    asyncio.run(bench(db_path, rows_path, changed_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare offset and cursor pagination of profile history at increasing depth.
+
+Seeds one user with ``--rows`` history rows in SQLite, then times fetching a
+page at several depths with ``page`` and with the keyset cursor.
+
+Run from ``backend/``::
+
+    python services/profile/benchmarks/bench_history.py --rows 1000000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.profile.app import crud, models
+from services.profile.app.database import Base
+
+
+def seed(path: str, user_id: uuid.UUID, rows: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Profile), [{"user_id": user_id, "first_name": "Bench"}])
+        for offset in range(0, rows, 100_000):
+            conn.execute(insert(models.ProfileHistory), [
+                {"user_id": user_id, "field": "city", "new_value": str(i), "changed_at": start + timedelta(seconds=i // 3)}
+                for i in range(offset, min(offset + 100_000, rows))
+            ])
+    engine.dispose()
+
+
+async def timed(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+async def bench(path: str, user_id: uuid.UUID, rows: int, per_page: int, repeat: int):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with AsyncSession(engine) as db:
+        print(f"{'depth':>10} {'offset ms':>10} {'cursor ms':>10}")
+        for depth in (0, 1_000, 10_000, 100_000, rows // 2, rows - per_page):
+            if depth < 0 or depth >= rows:
+                continue
+            page = depth // per_page + 1
+            # Build the cursor for the row just before this page (not timed)
+            after = None
+            if page > 1:
+                previous = await db.scalar(
+                    select(models.ProfileHistory)
+                    .where(models.ProfileHistory.user_id == user_id)
+                    .order_by(models.ProfileHistory.changed_at.desc(), models.ProfileHistory.id.desc())
+                    .offset((page - 1) * per_page - 1)
+                    .limit(1)
+                )
+                after = crud.decode_history_cursor(crud.encode_history_cursor(previous))
+            skip = (page - 1) * per_page
+            offset_ms = await timed(lambda: crud.list_history(db, user_id, skip=skip, limit=per_page), repeat)
+            cursor_ms = await timed(lambda: crud.list_history(db, user_id, limit=per_page, after=after), repeat)
+            db.expunge_all()
+            print(f"{skip:>10} {offset_ms:>10.2f} {cursor_ms:>10.2f}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--per-page", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    user_id = uuid.uuid4()
+    start = time.perf_counter()
+    seed(path, user_id, args.rows)
+    print(f"seeded {args.rows} rows in {time.perf_counter() - start:.1f}s")
+    asyncio.run(bench(path, user_id, args.rows, args.per_page, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Measure profile history archiving over a multi-year SQLite dataset.
+
+Seeds ``--rows`` history rows for ``--users`` users spread evenly over
+``--years`` years, walks the history of ``--sample`` users page by page, then
+archives everything older than ``--retention-months`` and walks the same
+histories again. Prints database and archive sizes and page latencies, split
+into pages served from the table and pages that reach into the archive.
+
+Run from ``backend/``::
+
+    python services/profile/benchmarks/bench_retention.py --rows 3000000 --years 3
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.profile.app import crud, models, retention
+from services.profile.app.archive import history_archive, utc
+from services.profile.app.database import Base
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+FIELDS = ["city", "company", "position", "nickname", "country"]
+
+
+def random_uuid(rng: random.Random) -> uuid.UUID:
+    # SQLite gives the UUID column numeric affinity, so a hex string that parses
+    # as a number would be stored as one; redraw those
+    while True:
+        value = uuid.UUID(int=rng.getrandbits(128), version=4)
+        if any(c in "abcdf" for c in value.hex):
+            return value
+
+
+def seed(path: str, users: list[uuid.UUID], rows: int, years: int, rng: random.Random):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    span = timedelta(days=365 * years).total_seconds()
+    start = NOW - timedelta(days=365 * years)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Profile), [{"user_id": user_id, "first_name": "Bench"} for user_id in users])
+        for offset in range(0, rows, 100_000):
+            conn.execute(insert(models.ProfileHistory.__table__), [
+                {
+                    "user_id": rng.choice(users),
+                    "field": rng.choice(FIELDS),
+                    "old_value": f"value{rng.randrange(1000)}",
+                    "new_value": f"value{rng.randrange(1000)}",
+                    "changed_at": start + timedelta(seconds=span * (i / rows)),
+                    "changed_by": None,
+                }
+                for i in range(offset, min(offset + 100_000, rows))
+            ])
+    engine.dispose()
+
+
+def size_mb(path: str) -> float:
+    """Pages in use, ignoring pages freed by deletes that only VACUUM would return."""
+    conn = sqlite3.connect(path)
+    page_size, = conn.execute("PRAGMA page_size").fetchone()
+    pages, = conn.execute("PRAGMA page_count").fetchone()
+    free, = conn.execute("PRAGMA freelist_count").fetchone()
+    conn.close()
+    return (pages - free) * page_size / 2**20
+
+
+async def walk(engine, users: list[uuid.UUID], cutoff: datetime, per_page: int) -> tuple[list[float], list[float], int]:
+    """Page through each user's history by cursor; returns (table page ms, archive page ms, entries)."""
+    hot, archived, total = [], [], 0
+    async with AsyncSession(engine) as db:
+        for user_id in users:
+            after = None
+            while True:
+                start = time.perf_counter()
+                entries = await crud.list_history(db, user_id, limit=per_page, after=after)
+                elapsed = (time.perf_counter() - start) * 1000
+                db.expunge_all()
+                if not entries:
+                    break
+                total += len(entries)
+                (archived if utc(entries[-1].changed_at) < cutoff else hot).append(elapsed)
+                if len(entries) < per_page:
+                    break
+                after = (entries[-1].changed_at, entries[-1].id)
+    return hot, archived, total
+
+
+def report(label: str, timings: list[float]):
+    if not timings:
+        return
+    timings = sorted(timings)
+    p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+    print(f"  {label:<16} {len(timings):>6} pages  p50={statistics.median(timings):.2f}ms  p99={p99:.2f}ms")
+
+
+async def bench(path: str, sample: list[uuid.UUID], retention_months: int, per_page: int):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    cutoff = datetime.combine(retention.add_months(retention.month_start(NOW), -retention_months), datetime.min.time(), timezone.utc)
+
+    hot, archived, before = await walk(engine, sample, cutoff, per_page)
+    print("before archiving:")
+    report("older pages", archived)
+    report("recent pages", hot)
+
+    start = time.perf_counter()
+    async with AsyncSession(engine) as db:
+        moved = await retention.archive_expired(db, retention_months, now=NOW)
+    elapsed = time.perf_counter() - start
+    rows = sum(moved.values())
+    print(f"archived {rows} rows from {len(moved)} months in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)")
+    print(f"database in use {size_mb(path):.0f} MB, archive {os.path.getsize(history_archive.path) / 2**20:.0f} MB")
+
+    hot, archived, after = await walk(engine, sample, cutoff, per_page)
+    assert after == before, (before, after)
+    print("after archiving:")
+    report("archive pages", archived)
+    report("table pages", hot)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--retention-months", type=int, default=12)
+    parser.add_argument("--sample", type=int, default=200)
+    parser.add_argument("--per-page", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "history.db")
+    history_archive.path = os.path.join(directory, "archive.db")
+    users = [random_uuid(rng) for _ in range(args.users)]
+    start = time.perf_counter()
+    seed(path, users, args.rows, args.years, rng)
+    print(f"seeded {args.rows} rows over {args.years} years in {time.perf_counter() - start:.1f}s, database {size_mb(path):.0f} MB")
+    asyncio.run(bench(path, rng.sample(users, args.sample), args.retention_months, args.per_page))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Measure profile search latency over a large database.
+
+Seeds ``--profiles`` random profiles into a temporary SQLite file (the FTS
+index is filled by its triggers) or, with ``--url``, into an empty PostgreSQL
+database, then runs random prefix searches, a third of them filtered by
+country, each followed by a second page through the cursor.
+
+Run from ``backend/``::
+
+    python services/profile/benchmarks/bench_search.py --profiles 1000000 --queries 500
+    python services/profile/benchmarks/bench_search.py --url postgresql+psycopg2://user@localhost/search_bench
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(ROOT))
+
+from services.profile.app import crud, models
+from services.profile.app.database import ASYNC_DRIVERS, Base
+
+FIRST_NAMES = ["anna", "boris", "carla", "dmitry", "elena", "fedor", "galina", "igor", "julia", "kirill",
+               "larisa", "maxim", "nadia", "oleg", "polina", "roman", "sofia", "timur", "ulyana", "viktor"]
+COMPANIES = ["acme", "globex", "initech", "umbrella", "hooli", "vandelay", "stark", "wayne", "tyrell", "cyberdyne"]
+CITIES = ["moscow", "kazan", "omsk", "tomsk", "samara", "perm", "ufa", "sochi", "tver", "kaluga"]
+POSITIONS = ["engineer", "designer", "manager", "analyst", "tester", "student", "teacher", "writer"]
+COUNTRIES = [f"country{i}" for i in range(50)]
+
+
+def _word(rng: random.Random, pool: list[str]) -> str:
+    # A numbered variant of a common word gives the index a realistic vocabulary size
+    return f"{rng.choice(pool)}{rng.randrange(1000)}" if rng.random() < 0.5 else rng.choice(pool)
+
+
+def seed(url: str, profiles: int, rng: random.Random):
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for offset in range(0, profiles, 50_000):
+            conn.execute(insert(models.Profile), [
+                {
+                    "user_id": uuid.uuid4(),
+                    "first_name": _word(rng, FIRST_NAMES).title(),
+                    "nickname": f"user{i}",
+                    "company": _word(rng, COMPANIES),
+                    "city": rng.choice(CITIES),
+                    "position": rng.choice(POSITIONS),
+                    "country": rng.choice(COUNTRIES),
+                }
+                for i in range(offset, min(offset + 50_000, profiles))
+            ])
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM ANALYZE profiles")
+    engine.dispose()
+
+
+async def bench(url: str, queries: int, rng: random.Random):
+    url = make_url(url)
+    engine = create_async_engine(url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername)))
+    words = FIRST_NAMES + COMPANIES + CITIES + POSITIONS
+    timings = []
+    async with AsyncSession(engine) as db:
+        for _ in range(queries):
+            q = " ".join(rng.choice(words)[: rng.randint(2, 5)] for _ in range(rng.randint(1, 2)))
+            country = rng.choice(COUNTRIES) if rng.random() < 1 / 3 else None
+            start = time.perf_counter()
+            _, cursor = await crud.search_profiles(db, q, country=country)
+            timings.append(time.perf_counter() - start)
+            if cursor:
+                start = time.perf_counter()
+                await crud.search_profiles(db, q, country=country, after=crud.decode_search_cursor(cursor, engine.dialect.name))
+                timings.append(time.perf_counter() - start)
+            db.expunge_all()
+    await engine.dispose()
+    timings.sort()
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1000
+    print(f"{len(timings)} searches  p50={p50:.1f}ms  p99={p99:.1f}ms  max={timings[-1] * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="empty database to seed; a temporary SQLite file by default")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'search.db')}"
+    start = time.perf_counter()
+    seed(url, args.profiles, rng)
+    print(f"seeded {args.profiles} profiles in {time.perf_counter() - start:.1f}s")
+    asyncio.run(bench(url, args.queries, rng))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Drive a running service with many concurrent clients and report req/s and latency.
+
+Start the service with uvicorn, then from ``backend/``::
+
+    python services/profile/benchmarks/load_test.py http://localhost:8000/api/profile?user_id=<id> --clients 500 --requests 20000
+
+Works against any GET endpoint, e.g. the auth or profile service, so the same
+command can be run before and after a change to compare.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _client(client: httpx.AsyncClient, url: str, remaining: list, latencies: list, errors: list):
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        start = time.perf_counter()
+        try:
+            resp = await client.get(url)
+            if resp.status_code >= 400:
+                errors.append(resp.status_code)
+        except httpx.HTTPError as exc:
+            errors.append(type(exc).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url: str, clients: int, requests: int):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    latencies, errors, remaining = [], [], [requests]
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(_client(client, url, remaining, latencies, errors) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"clients={clients} requests={len(latencies)} errors={len(errors)}")
+    print(f"{len(latencies) / elapsed:.0f} req/s  p50={p50:.1f}ms  p99={p99:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("url")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.clients, args.requests))
+
+
+if __name__ == "__main__":
+    main()
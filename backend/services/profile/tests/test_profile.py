@@ -1,17 +1,33 @@
+import asyncio
+import csv
+import io
+import json
+import os
 import sys
 import uuid
+from datetime import date, datetime, timedelta
 from pathlib import Path
+import pytest
 from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
 
 # Ensure package imports work when running via pytest
 sys.path.append(str(Path(__file__).resolve().parents[3]))
 
-from services.profile.app.main import app, Base, engine, SessionLocal
-from services.profile.app import models
+from services.profile.app.main import app
+from services.profile.app.database import AsyncSessionLocal, engine, init_db
+from services.profile.app import avatars, crud, models, retention, schemas, thumbnails
+from services.profile.app.archive import history_archive
+from services.profile.app.cache import ProfileCache
+from services.profile.app.refcache import ReferenceCache
 
-Base.metadata.create_all(bind=engine)
+asyncio.run(init_db())
 
 client = TestClient(app)
+# Test fixtures are written through a sync engine on the same database
+SessionLocal = sessionmaker(bind=create_engine(os.getenv("PROFILE_DATABASE_URL", "sqlite:///./profile.db")))
 
 
 def test_create_and_read_profile():
@@ -41,3 +57,524 @@ def test_experience_level_crud():
 
     response = client.delete(f"/api/experience-levels/{level_id}")
     assert response.status_code == 200
+
+
+def test_update_profile_records_history():
+    user_id = uuid.uuid4()
+    db = SessionLocal()
+    db.add(models.Profile(user_id=user_id, first_name="Ann"))
+    db.commit()
+    db.close()
+
+    response = client.put(f"/api/profile?user_id={user_id}", json={"first_name": "Anna", "city": "Kazan"})
+    assert response.status_code == 200
+    assert response.json()["city"] == "Kazan"
+
+    response = client.get(f"/api/profile/history?user_id={user_id}")
+    assert response.status_code == 200
+    assert {h["field"] for h in response.json()} == {"first_name", "city"}
+
+
+def test_update_profile_writes_history_in_one_statement():
+    user_id = uuid.uuid4()
+    db = SessionLocal()
+    db.add(models.Profile(user_id=user_id, first_name="Bob"))
+    db.commit()
+    db.close()
+
+    statements, commits = [], []
+
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement.split()[0].upper())
+
+    def on_commit(conn):
+        commits.append(1)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    event.listen(engine.sync_engine, "commit", on_commit)
+    try:
+        changed = client.put(f"/api/profile?user_id={user_id}", json={"first_name": "Bob", "city": "Omsk", "company": "Acme", "position": "Dev"})
+        after_update = (list(statements), len(commits))
+        del statements[:]
+        unchanged = client.put(f"/api/profile?user_id={user_id}", json={"first_name": "Bob", "city": "Omsk"})
+        after_noop = (list(statements), len(commits) - after_update[1])
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+        event.remove(engine.sync_engine, "commit", on_commit)
+
+    assert changed.json()["company"] == "Acme"
+    # profile + social accounts lookup, one multi-row history INSERT, one UPDATE, no refresh
+    assert after_update == (["SELECT", "SELECT", "INSERT", "UPDATE"], 1)
+    assert unchanged.json()["city"] == "Omsk"
+    assert after_noop == (["SELECT", "SELECT"], 0)
+    assert len(client.get(f"/api/profile/history?user_id={user_id}").json()) == 3
+
+
+def test_read_profile_cached_with_etag():
+    user_id = uuid.uuid4()
+    db = SessionLocal()
+    db.add(models.Profile(user_id=user_id, first_name="Kate"))
+    db.commit()
+    db.close()
+
+    first = client.get(f"/api/profile?user_id={user_id}")
+    etag = first.headers["ETag"]
+    queries = []
+
+    def on_execute(*args):
+        queries.append(1)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        assert client.get(f"/api/profile?user_id={user_id}").json() == first.json()
+        not_modified = client.get(f"/api/profile?user_id={user_id}", headers={"If-None-Match": etag})
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+    assert queries == []
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    for header in (f"W/{etag}", f'"other", {etag}', "*"):
+        assert client.get(f"/api/profile?user_id={user_id}", headers={"If-None-Match": header}).status_code == 304
+    assert client.get(f"/api/profile?user_id={user_id}", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    # every write path drops the cached copy and changes the ETag
+    client.put(f"/api/profile?user_id={user_id}", json={"first_name": "Katya"})
+    updated = client.get(f"/api/profile?user_id={user_id}", headers={"If-None-Match": etag})
+    assert updated.status_code == 200
+    assert updated.json()["first_name"] == "Katya"
+    assert updated.headers["ETag"] != etag
+
+    client.post(f"/api/profile/social/link?user_id={user_id}&provider=github&provider_id=kate")
+    linked = client.get(f"/api/profile?user_id={user_id}", headers={"If-None-Match": updated.headers["ETag"]})
+    assert linked.status_code == 200
+    assert [a["provider"] for a in linked.json()["social_accounts"]] == ["github"]
+
+    client.delete(f"/api/profile/social/github?user_id={user_id}")
+    assert client.get(f"/api/profile?user_id={user_id}").json()["social_accounts"] == []
+
+    stats = client.get("/internal/profile/metrics").json()["profile_cache"]
+    assert stats["hits"] >= 2
+    assert 0 < stats["hit_ratio"] < 1
+    assert stats["entries"] <= stats["max_entries"]
+
+
+def test_profile_cache_evicts_least_recently_used():
+    cache = ProfileCache(maxsize=2, ttl=60)
+    a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    cache.set(a, '"1"', b"a")
+    cache.set(b, '"1"', b"b")
+    cache.get(a)
+    cache.set(c, '"1"', b"c")
+    assert cache.get(b) is None
+    assert cache.get(a) == ('"1"', b"a")
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["body_bytes"] == 2
+
+    expired = ProfileCache(maxsize=2, ttl=0)
+    expired.set(a, '"1"', b"a")
+    assert expired.get(a) is None
+
+
+def _batch_queries(user_ids):
+    queries = []
+
+    def on_execute(*args):
+        queries.append(1)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.post("/api/profile/batch", json={"user_ids": [str(u) for u in user_ids]})
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+    assert response.status_code == 200
+    return response.json(), len(queries)
+
+
+def test_batch_lookup_keeps_order_with_constant_queries():
+    db = SessionLocal()
+    user_ids = [uuid.uuid4() for _ in range(50)]
+    for i, user_id in enumerate(user_ids):
+        db.add(models.Profile(user_id=user_id, first_name=f"User {i}"))
+        db.add(models.SocialBinding(user_id=user_id, provider="github", provider_id=str(i)))
+    db.commit()
+    db.close()
+
+    missing = uuid.uuid4()
+    requested = [user_ids[3], missing, user_ids[0]]
+    items, small_batch_queries = _batch_queries(requested)
+    assert [item["user_id"] for item in items] == [str(u) for u in requested]
+    assert [item["found"] for item in items] == [True, False, True]
+    assert items[1]["profile"] is None
+    assert items[0]["profile"]["first_name"] == "User 3"
+    assert items[0]["profile"]["social_accounts"][0]["provider_id"] == "3"
+
+    items, large_batch_queries = _batch_queries(user_ids)
+    assert all(item["found"] for item in items)
+    assert small_batch_queries == large_batch_queries == 2  # profiles IN (...) + social accounts
+
+
+def test_batch_lookup_rejects_oversized_batch():
+    response = client.post("/api/profile/batch", json={"user_ids": [str(uuid.uuid4()) for _ in range(schemas.MAX_BATCH_SIZE + 1)]})
+    assert response.status_code == 422
+
+
+def _png(color="red", size=(300, 200)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+PNG = _png()
+
+
+def test_avatar_upload_is_content_addressed(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, "AVATAR_DIR", str(tmp_path))
+    first, second = uuid.uuid4(), uuid.uuid4()
+    # content_type is not trusted, only the magic bytes
+    urls = [
+        client.post(f"/api/profile/avatar?user_id={user_id}", files={"file": ("me.bin", PNG, "application/octet-stream")}).json()["avatar_url"]
+        for user_id in (first, second)
+    ]
+    assert urls[0] == urls[1]
+    assert urls[0].endswith(".png")
+    assert Path(urls[0]).name in [p.name for p in tmp_path.iterdir()]
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_avatar_upload_rejects_bad_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, "AVATAR_DIR", str(tmp_path))
+    user_id = uuid.uuid4()
+    fake = client.post(f"/api/profile/avatar?user_id={user_id}", files={"file": ("a.png", b"not an image", "image/png")})
+    assert fake.status_code == 400
+
+    too_large = PNG + b"\x00" * avatars.MAX_AVATAR_SIZE
+    response = client.post(f"/api/profile/avatar?user_id={user_id}", files={"file": ("a.png", too_large, "image/png")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "File too large"
+    assert list(tmp_path.iterdir()) == []  # partial uploads are removed
+
+
+def test_avatar_upload_rejected_before_body_is_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, "AVATAR_DIR", str(tmp_path))
+    monkeypatch.setattr(avatars, "MAX_AVATAR_SIZE", 64 * 1024)
+    boundary = "avatar-boundary"
+    content_type = f"multipart/form-data; boundary={boundary}"
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.png"\r\n'
+            "Content-Type: image/png\r\n\r\n").encode() + PNG
+    received = []
+
+    async def body(chunks: int):
+        for chunk in [head] + [b"\x00" * 16 * 1024] * chunks + [f"\r\n--{boundary}--\r\n".encode()]:
+            received.append(len(chunk))
+            yield chunk
+
+    # Reading stops once the file part crosses the limit
+    with pytest.raises(avatars.AvatarTooLarge):
+        asyncio.run(avatars.store_multipart(body(1000), content_type))
+    assert sum(received) < avatars.MAX_AVATAR_SIZE + 32 * 1024
+    assert list(tmp_path.iterdir()) == []
+    path = asyncio.run(avatars.store_multipart(body(1), content_type))
+    assert Path(path).read_bytes() == PNG + b"\x00" * 16 * 1024
+
+    # A declared length over the limit is refused before the body is touched
+    async def unexpected(*args):
+        raise AssertionError("body read")
+
+    monkeypatch.setattr(avatars, "store_multipart", unexpected)
+    response = client.post(
+        f"/api/profile/avatar?user_id={uuid.uuid4()}",
+        files={"file": ("a.png", PNG + b"\x00" * (avatars.MAX_AVATAR_SIZE + avatars.MULTIPART_OVERHEAD), "image/png")},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "File too large"
+
+
+def test_avatar_thumbnails_served_immutable(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, "AVATAR_DIR", str(tmp_path))
+    user_id = uuid.uuid4()
+    body = client.post(f"/api/profile/avatar?user_id={user_id}", files={"file": ("a.png", _png("blue"), "image/png")}).json()
+    assert set(body["thumbnails"]) == {"webp", "jpg"}
+
+    for ext, sizes in body["thumbnails"].items():
+        for size, url in sizes.items():
+            response = client.get(url)
+            assert response.status_code == 200
+            assert "immutable" in response.headers["cache-control"]
+            with Image.open(io.BytesIO(response.content)) as image:
+                assert image.size == (int(size), int(size))
+                assert image.format == thumbnails.FORMATS[ext]
+
+    # variants that were never generated are produced on first request
+    digest = Path(body["avatar_url"]).stem
+    (tmp_path / thumbnails.variant_name(digest, 32, "jpg")).unlink()
+    assert client.get(body["thumbnails"]["jpg"]["32"]).status_code == 200
+
+    assert client.get(f"/api/profile/avatars/{'0' * 64}_32.jpg").status_code == 404
+    assert client.get(f"/api/profile/avatars/{digest}_33.jpg").status_code == 404
+
+    # profile reads carry the variant URLs, so lists never need the original
+    assert client.get(f"/api/profile?user_id={user_id}").json()["avatar_thumbnails"] == body["thumbnails"]
+    batch = client.post("/api/profile/batch", json={"user_ids": [str(user_id)]}).json()
+    assert batch[0]["profile"]["avatar_thumbnails"] == body["thumbnails"]
+
+    # an original that cannot be decoded yields no variant rather than a server error
+    corrupt = "f" * 64
+    (tmp_path / f"{corrupt}.png").write_bytes(PNG[:16] + b"\x00" * 64)
+    assert client.get(f"/api/profile/avatars/{corrupt}_32.jpg").status_code == 404
+
+
+def test_history_keyset_pagination_uses_index():
+    user_id = uuid.uuid4()
+    db = SessionLocal()
+    db.add(models.Profile(user_id=user_id, first_name="Hist"))
+    same_second = datetime(2024, 5, 1, 12, 0, 0)
+    db.add_all(
+        models.ProfileHistory(user_id=user_id, field="city", new_value=str(i), changed_at=same_second if i % 3 else same_second + timedelta(minutes=i))
+        for i in range(45)
+    )
+    db.commit()
+    db.close()
+
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if "FROM profile_history" in statement:
+            statements.append((statement, parameters))
+
+    seen, cursor, pages = [], None, 0
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        while True:
+            url = f"/api/profile/history?user_id={user_id}&per_page=20" + (f"&cursor={cursor}" if cursor else "")
+            response = client.get(url)
+            assert response.status_code == 200
+            seen += [entry["new_value"] for entry in response.json()]
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+
+    assert pages == 3
+    assert len(seen) == len(set(seen)) == 45
+    offset_pages = [e["new_value"] for p in (1, 2, 3) for e in client.get(f"/api/profile/history?user_id={user_id}&page={p}&per_page=20").json()]
+    assert seen == offset_pages
+
+    statement, parameters = statements[-1]
+    with SessionLocal.kw["bind"].connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+    assert any("ix_profile_history_user_changed" in step for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+    assert client.get(f"/api/profile/history?user_id={user_id}&cursor=bogus").status_code == 400
+
+
+def test_history_retention_archives_old_months(tmp_path, monkeypatch):
+    user_id = uuid.uuid4()
+    db = SessionLocal()
+    db.add(models.Profile(user_id=user_id, first_name="Old"))
+    db.add_all(
+        models.ProfileHistory(user_id=user_id, field="city", new_value=str(i), changed_at=datetime(2001, 1, 1) + timedelta(days=20 * i))
+        for i in range(45)
+    )
+    db.commit()
+    db.close()
+
+    def offset_pages():
+        return [e["new_value"] for p in (1, 2, 3) for e in client.get(f"/api/profile/history?user_id={user_id}&page={p}&per_page=20").json()]
+
+    expected = offset_pages()
+    assert expected == [str(i) for i in reversed(range(45))]
+
+    async def archive():
+        async with AsyncSessionLocal() as db:
+            return await retention.archive_expired(db, retention_months=12, now=datetime(2003, 7, 1))
+
+    # Without an archive configured, history stays in the database
+    monkeypatch.setattr(history_archive, "path", "")
+    assert asyncio.run(archive()) == {}
+    assert offset_pages() == expected
+
+    # Months before July 2002 are archived: rows 0-27
+    monkeypatch.setattr(history_archive, "path", str(tmp_path / "archive.db"))
+    moved = asyncio.run(archive())
+    assert min(moved) == "2001-01" and max(moved) == "2002-06"
+    assert sum(moved.values()) == 28
+    assert sum(entries for _, entries in history_archive.months().values()) == 28
+    assert asyncio.run(archive()) == {}
+    db = SessionLocal()
+    assert db.query(models.ProfileHistory).filter_by(user_id=user_id).count() == 17
+    db.close()
+
+    seen, cursor = [], None
+    while True:
+        url = f"/api/profile/history?user_id={user_id}&per_page=20" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        seen += [entry["new_value"] for entry in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+    assert offset_pages() == expected
+
+
+def test_experience_levels_served_from_versioned_cache():
+    # Another worker's cache, checking the version on every call
+    other_worker = ReferenceCache("experience_levels", crud._load_experience_levels, check_interval=0)
+
+    async def other_worker_labels():
+        async with AsyncSessionLocal() as db:
+            return [level.label for level in await other_worker.get(db)]
+
+    before = asyncio.run(other_worker_labels())
+    client.get("/api/experience-levels")
+    queries = []
+
+    def on_execute(*args):
+        queries.append(1)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        client.get("/api/experience-levels")
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+    assert queries == []
+
+    level_id = client.post("/api/experience-levels", json={"label": "Staff", "sequence": 9}).json()["id"]
+    assert "Staff" in [level["label"] for level in client.get("/api/experience-levels").json()]
+    assert asyncio.run(other_worker_labels()) == before + ["Staff"]
+
+    client.put(f"/api/experience-levels/{level_id}", json={"label": "Principal", "sequence": 9})
+    assert "Principal" in asyncio.run(other_worker_labels())
+    client.delete(f"/api/experience-levels/{level_id}")
+    assert asyncio.run(other_worker_labels()) == before
+
+
+def test_search_profiles_by_prefix_with_filters_and_cursor():
+    country = f"Land{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    people = [("Jonathan", "Acme"), ("Joanna", "Initech"), ("Bob", "Joyful Games"), ("Alice", "Acme")]
+    user_ids = []
+    for first_name, company in people:
+        user_id = uuid.uuid4()
+        user_ids.append(user_id)
+        db.add(models.Profile(user_id=user_id, first_name=first_name, company=company, country=country))
+    db.commit()
+    db.close()
+
+    def search(**params):
+        response = client.get("/api/profile/search", params={"country": country, **params})
+        assert response.status_code == 200
+        return [p["first_name"] for p in response.json()], response.headers.get("X-Next-Cursor")
+
+    assert sorted(search(q="jo")[0]) == ["Bob", "Joanna", "Jonathan"]
+    assert search(q="jo acme")[0] == ["Jonathan"]
+    assert sorted(search(q="ACM")[0]) == ["Alice", "Jonathan"]
+    assert search(q="jo", country="Nowhere")[0] == []
+
+    first_page, cursor = search(q="jo", limit=2)
+    second_page, last_cursor = search(q="jo", limit=2, cursor=cursor)
+    assert len(first_page) == 2 and len(second_page) == 1
+    assert sorted(first_page + second_page) == ["Bob", "Joanna", "Jonathan"]
+    assert last_cursor is None
+
+    # the index follows profile updates
+    client.put(f"/api/profile?user_id={user_ids[3]}", json={"first_name": "Joelle"})
+    assert "Joelle" in search(q="joe")[0]
+    assert search(q="alice")[0] == []
+    for bad_cursor in ["%%%", crud.encode_cursor(["abc"]), crud.encode_cursor([[1]]), crud.encode_cursor([True])]:
+        assert client.get("/api/profile/search", params={"q": "jo", "cursor": bad_cursor}).status_code == 400
+
+
+def test_bulk_import_upserts_and_writes_history_setwise():
+    existing, new = uuid.uuid4(), uuid.uuid4()
+    db = SessionLocal()
+    db.add(models.Profile(user_id=existing, first_name="Old", city="Omsk"))
+    db.commit()
+    db.close()
+
+    body = "\n".join(json.dumps(row) for row in [
+        {"user_id": str(existing), "first_name": "New", "city": "Perm", "company": "Acme"},
+        {"user_id": str(new), "first_name": "Fresh"},
+        {"user_id": str(new), "first_name": "Fresher"},
+        {"first_name": "No id"},
+        {"user_id": str(existing), "first_name": "New", "city": "Perm", "company": "Acme"},
+    ])
+    statements = []
+
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement.split()[0].upper())
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.post("/internal/profile/import", content=body)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["status"] for r in results] == ["skipped", "skipped", "created", "invalid", "updated"]
+    # existing rows lookup, new profiles, changed profiles, all history rows
+    assert statements == ["SELECT", "INSERT", "UPDATE", "INSERT"]
+
+    assert client.get(f"/api/profile?user_id={new}").json()["first_name"] == "Fresher"
+    history = client.get(f"/api/profile/history?user_id={existing}").json()
+    assert {(h["field"], h["old_value"], h["new_value"]) for h in history} == {
+        ("first_name", "Old", "New"), ("city", "Omsk", "Perm"), ("company", None, "Acme"),
+    }
+
+    csv_body = f"user_id,first_name,city\n{existing},New,Perm\n{new},Fresher,Kazan\n"
+    response = client.post("/internal/profile/import", content=csv_body, headers={"Content-Type": "text/csv"})
+    assert [json.loads(line)["status"] for line in response.text.splitlines()] == ["unchanged", "updated"]
+
+
+def test_bulk_import_rejects_unknown_levels_and_survives_concurrent_inserts():
+    level_id = client.post("/api/experience-levels", json={"label": "Import", "sequence": 9}).json()["id"]
+    racing, first, other = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    body = "\n".join(json.dumps(row) for row in [
+        {"user_id": str(first), "first_name": "Import", "experience_id": level_id},
+        {"user_id": str(uuid.uuid4()), "first_name": "Import", "experience_id": 10**9},
+        {"user_id": str(racing), "first_name": "Import"},
+        {"user_id": str(other), "first_name": "Import"},
+    ])
+
+    def create_racing_profile(conn, cursor, statement, *args):
+        # Another request creates the profile between the batch's lookup and its insert
+        if statement.startswith("INSERT INTO profiles") and not racing_created:
+            racing_created.append(True)
+            db = SessionLocal()
+            db.add(models.Profile(user_id=racing, first_name="Concurrent"))
+            db.commit()
+            db.close()
+
+    racing_created = []
+    event.listen(engine.sync_engine, "before_cursor_execute", create_racing_profile)
+    try:
+        response = client.post("/internal/profile/import", content=body)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", create_racing_profile)
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    # The batch is rolled back whole, and the stream still ends normally
+    assert [r["status"] for r in results] == ["error", "invalid", "error", "error"]
+    assert "experience level" in results[1]["error"]
+    assert client.get(f"/api/profile?user_id={first}").status_code == 404
+    assert client.get(f"/api/profile?user_id={racing}").json()["first_name"] == "Concurrent"
+
+
+def test_bulk_export_streams_every_profile():
+    user_id = uuid.uuid4()
+    db = SessionLocal()
+    db.add(models.Profile(user_id=user_id, first_name="Exported", birth_date=date(1990, 1, 2)))
+    db.commit()
+    total = db.query(models.Profile).count()
+    db.close()
+
+    ndjson = [json.loads(line) for line in client.get("/internal/profile/export").text.splitlines()]
+    assert len(ndjson) == total
+    assert [row["user_id"] for row in ndjson] == sorted(row["user_id"] for row in ndjson)
+    exported = next(row for row in ndjson if row["user_id"] == str(user_id))
+    assert exported["birth_date"] == "1990-01-02"
+
+    rows = list(csv.DictReader(io.StringIO(client.get("/internal/profile/export?format=csv").text)))
+    assert len(rows) == total
+    assert next(row for row in rows if row["user_id"] == str(user_id))["first_name"] == "Exported"